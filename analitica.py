@@ -0,0 +1,180 @@
+import heapq
+import sqlite3
+import threading
+from datetime import date
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Clave de cada agrupación calculada en SQL sobre fecha 'AAAA-MM-DD HH:MM:SS'.
+# La semana se identifica por la fecha de su lunes.
+AGRUPACIONES = {
+    'producto': 'COALESCE(producto_id, -1)',
+    'hora': 'CAST(substr(fecha, 12, 2) AS INTEGER)',
+    'dia': 'substr(fecha, 1, 10)',
+    'semana': "date(fecha, '-6 days', 'weekday 1')",
+    'mes': 'substr(fecha, 1, 7)',
+}
+TAMANO_LOTE_ANALITICA = 100_000
+MAX_PERIODOS_CACHE = 128
+
+
+def acumular(destino, clave, ventas, unidades, total):
+    anterior = destino.get(clave)
+    if anterior is None:
+        destino[clave] = [ventas, unidades, total]
+    else:
+        anterior[0] += ventas
+        anterior[1] += unidades
+        anterior[2] += total
+
+
+class Analitica:
+    # Reportes de ventas por producto y por período sobre rangos
+    # semiabiertos [desde, hasta). Los períodos cerrados (que terminan antes
+    # de hoy) ya no cambian, así que su resultado se guarda en memoria y
+    # reabrir un reporte mensual no vuelve a recorrer las ventas.
+    def __init__(self, app, motor='sql'):
+        self.app = app
+        self.motor = motor if motor != 'numpy' or np is not None else 'sql'
+        self._cache = {}
+        self._bloqueo = threading.Lock()
+
+    def ventas_por(self, agrupacion, desde, hasta):
+        # Lista de (clave, ventas, unidades, total) ordenada por clave
+        if agrupacion not in AGRUPACIONES:
+            raise ValueError(f"Agrupación desconocida: {agrupacion}")
+        cerrado = hasta <= date.today().isoformat()
+        clave_cache = (agrupacion, desde, hasta)
+        if cerrado:
+            with self._bloqueo:
+                if clave_cache in self._cache:
+                    return self._cache[clave_cache]
+        try:
+            if self.motor == 'numpy':
+                acumulado = self._agrupar_numpy(agrupacion, desde, hasta)
+            else:
+                acumulado = self._agrupar_sql(agrupacion, desde, hasta)
+        except sqlite3.Error as e:
+            print(f"Error al calcular ventas por {agrupacion}: {e}")
+            return []
+        resultado = [
+            (clave, ventas, unidades, total)
+            for clave, (ventas, unidades, total) in sorted(acumulado.items())
+        ]
+        if cerrado:
+            with self._bloqueo:
+                if len(self._cache) >= MAX_PERIODOS_CACHE:
+                    self._cache.pop(next(iter(self._cache)))
+                self._cache[clave_cache] = resultado
+        return resultado
+
+    def _agrupar_sql(self, agrupacion, desde, hasta):
+        # El índice idx_ventas_fecha_producto cubre la consulta: el rango
+        # de fechas se resuelve con una búsqueda y no se lee la tabla
+        acumulado = {}
+        for desde_tramo, hasta_tramo, meses in self.app.tramos_historicos(desde, hasta):
+            with self.app.conexion_historica(meses) as cursor:
+                cursor.execute(f'''
+                    SELECT {AGRUPACIONES[agrupacion]}, COUNT(*),
+                           COALESCE(SUM(cantidad), 0), COALESCE(SUM(total), 0)
+                    FROM ventas
+                    WHERE fecha >= ? AND fecha < ?
+                    GROUP BY 1
+                ''', (desde_tramo, hasta_tramo))
+                for fila in cursor:
+                    acumular(acumulado, *fila)
+        return acumulado
+
+    def _agrupar_numpy(self, agrupacion, desde, hasta):
+        # Lee las columnas por lotes y agrupa cada lote con np.unique y
+        # np.bincount; solo el resultado parcial queda en memoria
+        acumulado = {}
+        for desde_tramo, hasta_tramo, meses in self.app.tramos_historicos(desde, hasta):
+            with self.app.conexion_historica(meses) as cursor:
+                cursor.execute('''
+                    SELECT fecha, producto_id, cantidad, total FROM ventas
+                    WHERE fecha >= ? AND fecha < ?
+                ''', (desde_tramo, hasta_tramo))
+                while True:
+                    filas = cursor.fetchmany(TAMANO_LOTE_ANALITICA)
+                    if not filas:
+                        break
+                    fechas, productos, cantidades, totales = zip(*filas)
+                    claves = claves_numpy(agrupacion, fechas, productos)
+                    unicas, indices = np.unique(claves, return_inverse=True)
+                    ventas = np.bincount(indices, minlength=len(unicas))
+                    unidades = np.bincount(
+                        indices,
+                        weights=np.array(cantidades, dtype=float),
+                        minlength=len(unicas),
+                    )
+                    sumas = np.bincount(
+                        indices,
+                        weights=np.array(totales, dtype=float),
+                        minlength=len(unicas),
+                    )
+                    for clave, v, u, t in zip(unicas.tolist(), ventas, unidades, sumas):
+                        acumular(acumulado, clave, int(v), int(u), float(t))
+        return acumulado
+
+    def mas_vendidos(self, desde, hasta, n=10):
+        # Lista de (producto, unidades, total) de los n productos con más
+        # unidades vendidas
+        por_producto = self.ventas_por('producto', desde, hasta)
+        resultado = []
+        for id, _, unidades, total in sorted(
+            por_producto, key=lambda fila: fila[2], reverse=True
+        ):
+            producto = self.app.obtener_producto(id)
+            # Las ventas de productos eliminados no entran en el ranking
+            if producto is not None:
+                resultado.append((producto, unidades, total))
+                if len(resultado) == n:
+                    break
+        return resultado
+
+    def menos_vendidos(self, desde, hasta, n=10):
+        # Productos con menos unidades vendidas en el rango, incluidos los
+        # que no se vendieron; a igual venta primero los de más stock
+        vendidos = {
+            id: (unidades, total)
+            for id, _, unidades, total in self.ventas_por('producto', desde, hasta)
+        }
+        peores = heapq.nsmallest(
+            n,
+            self.app.obtener_productos(),
+            key=lambda producto: (
+                vendidos.get(producto.id, (0, 0))[0], -producto.cantidad
+            ),
+        )
+        return [
+            (producto, *vendidos.get(producto.id, (0, 0))) for producto in peores
+        ]
+
+    def invalidar_cache(self):
+        with self._bloqueo:
+            self._cache.clear()
+
+    def cerrar(self):
+        self.invalidar_cache()
+
+
+def claves_numpy(agrupacion, fechas, productos):
+    if agrupacion == 'producto':
+        return np.array([-1 if id is None else id for id in productos])
+    instantes = np.array(
+        [fecha.replace(' ', 'T') for fecha in fechas], dtype='datetime64[s]'
+    )
+    dias = instantes.astype('datetime64[D]')
+    if agrupacion == 'hora':
+        return (instantes - dias).astype('timedelta64[h]').astype(int)
+    if agrupacion == 'dia':
+        return dias.astype(str)
+    if agrupacion == 'semana':
+        # El 1970-01-01 fue jueves: se retrocede hasta el lunes de cada semana
+        retroceso = ((dias.astype(int) + 3) % 7).astype('timedelta64[D]')
+        return (dias - retroceso).astype(str)
+    return instantes.astype('datetime64[M]').astype(str)
@@ -1,32 +1,469 @@
-import flet as ft
-from flet import icons
 import sqlite3
-from datetime import datetime
+import asyncio
+from datetime import datetime, date, time, timedelta
 import csv
+import glob
+import gzip
+import os
+import queue
+import re
+import sys
+import atexit
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from analitica import Analitica
+from diagnostico import (
+    ConexionMedida,
+    barras,
+    diagnostico,
+    medir_actualizaciones,
+    medir_manejador,
+)
+from respaldo import Respaldos, restaurar
+
+# Flet solo hace falta para la interfaz: el servidor (servidor.py), los
+# benchmarks y las tareas de mantenimiento usan la capa de datos sin ella
+try:
+    import flet as ft
+    from flet import icons
+except ImportError:
+    ft = icons = None
+
+RUTA_BD = 'inventario_caja.db'
+TAMANO_PAGINA = 60
+LIMITE_BUSQUEDA = 50
+LIMITE_DIAGNOSTICO = 30
+LIMITE_FILAS_REPORTE = 200
+# Espera tras la última tecla antes de lanzar la búsqueda
+RETARDO_BUSQUEDA = 0.25
+# Límites inferiores de las bandas de precio de la valorización de inventario
+BANDAS_PRECIO = (1000, 10000, 100000)
+# Segundos que una conexión espera el bloqueo de escritura de otra terminal
+# antes de fallar con "database is locked"
+TIEMPO_ESPERA_BLOQUEO = 10
+FORMATO_FECHA = '%Y-%m-%d %H:%M:%S'
+
+# Las fechas se guardan como texto 'AAAA-MM-DD HH:MM:SS', así que un rango
+# semiabierto sobre la columna sin funciones aprovecha los índices de ventas
+CONSULTA_TOTAL_RANGO = 'SELECT SUM(total) FROM ventas WHERE fecha >= ? AND fecha < ?'
+CONSULTA_TOTALES_METODO_RANGO = (
+    'SELECT metodo_pago, SUM(total) FROM ventas '
+    'WHERE fecha >= ? AND fecha < ? GROUP BY metodo_pago'
+)
+# Consultas de rango sobre ventas que deben buscar en un índice; los totales
+# sin rango salen de las tablas de resumen y no leen ventas
+CONSULTAS_RANGO_VENTAS = {
+    'total_rango': CONSULTA_TOTAL_RANGO,
+    'totales_metodo_rango': CONSULTA_TOTALES_METODO_RANGO,
+}
+
+
+# Consultas de exportación: encabezado, SELECT y filtro opcional por rango
+# semiabierto de fechas (AAAA-MM-DD) sobre la columna indexada
+EXPORTACIONES = {
+    'productos': (
+        ['ID', 'Nombre', 'Precio', 'Cantidad', 'Valor Total'],
+        'SELECT id, nombre, precio, cantidad, precio * cantidad FROM productos',
+        None,
+        'id',
+    ),
+    'ventas': (
+        ['ID', 'Fecha', 'Producto ID', 'Producto', 'Cantidad', 'Total', 'Método de Pago'],
+        'SELECT v.id, v.fecha, v.producto_id, p.nombre, v.cantidad, v.total, '
+        'v.metodo_pago FROM ventas v LEFT JOIN productos p ON p.id = v.producto_id',
+        'v.fecha',
+        'v.fecha',
+    ),
+    'resumen_diario': (
+        ['Día', 'Método de Pago', 'Ventas', 'Total', 'Unidades'],
+        'SELECT dia, metodo_pago, ventas, total, unidades FROM resumen_diario',
+        'dia',
+        'dia, metodo_pago',
+    ),
+}
+TAMANO_LOTE_EXPORTACION = 5000
+TAMANO_LOTE_IMPORTACION = 5000
+TAMANO_LOTE_MIGRACION = 10000
+
+# Las ventas de meses cerrados se archivan en un archivo por mes junto a la
+# base principal. SQLite admite como mucho 10 bases adjuntas por conexión.
+COLUMNAS_VENTAS = 'id, producto_id, cantidad, total, metodo_pago, fecha'
+MAX_ARCHIVOS_ADJUNTOS = 10
+
+# Libro de movimientos de stock (kardex): cada cambio de cantidad o precio
+# deja una fila con la diferencia y el precio resultante. Cada tantos
+# movimientos se guarda, en segundo plano, una instantánea del stock de los
+# productos que se movieron para no reproducir todo el historial al
+# consultar una fecha pasada.
+INSERTAR_MOVIMIENTO = (
+    'INSERT INTO movimientos (producto_id, fecha, tipo, cantidad, precio) '
+    'VALUES (?, ?, ?, ?, ?)'
+)
+MOVIMIENTOS_POR_INSTANTANEA = 10000
+TAMANO_LOTE_CACHE = 500
+# Valor por omisión de los campos opcionales que no se deben modificar
+SIN_CAMBIO = object()
+
+
+def expresion_banda(columna):
+    # Número de la banda de precio: cuántos límites de BANDAS_PRECIO alcanza
+    return ' + '.join(f'({columna} >= {limite})' for limite in BANDAS_PRECIO)
+
+
+def etiqueta_banda(banda):
+    desde = BANDAS_PRECIO[banda - 1] if banda > 0 else 0
+    if banda < len(BANDAS_PRECIO):
+        return f"${desde} - ${BANDAS_PRECIO[banda]}"
+    return f"${desde} o más"
+
+
+def rango_dia(dia=None):
+    inicio = datetime.combine(dia or date.today(), time.min)
+    fin = inicio + timedelta(days=1)
+    return inicio.strftime(FORMATO_FECHA), fin.strftime(FORMATO_FECHA)
+
+
+def inicio_mes_siguiente(mes):
+    anio, numero = map(int, mes.split('-'))
+    return f'{anio + numero // 12:04d}-{numero % 12 + 1:02d}-01'
+
+def sincronizado(metodo):
+    # La conexión se comparte con el hilo de commit agrupado
+    @functools.wraps(metodo)
+    def envoltura(self, *args, **kwargs):
+        with self._bloqueo:
+            return metodo(self, *args, **kwargs)
+    return envoltura
 
 class Producto:
-    def __init__(self, id, nombre, precio, cantidad):
+    # Sin __dict__ por instancia: los catálogos grandes viven en la caché
+    __slots__ = ('id', 'nombre', 'precio', 'cantidad', 'sku')
+
+    def __init__(self, id, nombre, precio, cantidad, sku=None):
         self.id = id
         self.nombre = nombre
         self.precio = precio
         self.cantidad = cantidad
+        self.sku = sku
+
+
+def fila_a_producto(cursor, row):
+    return Producto(*row)
 
 class InventarioCajaApp:
-    def __init__(self):
-        self.conn = sqlite3.connect('inventario_caja.db')
+    def __init__(
+        self,
+        ruta=RUTA_BD,
+        commit_agrupado=False,
+        intervalo_commit_ms=50,
+        max_operaciones_commit=200,
+        lectores=1,
+    ):
+        self.ruta = ruta
+        # Una conexión escritora y un pool de lectoras: en WAL las lecturas
+        # no esperan al escritor de esta ni de otras terminales. El escritor
+        # abre sus transacciones con BEGIN IMMEDIATE para tomar el bloqueo
+        # de escritura al inicio y esperar su turno con busy_timeout. Con
+        # más de una lectora, varios hilos pueden consultar a la vez.
+        self.conn = self._conectar(isolation_level='IMMEDIATE')
         self.cursor = self.conn.cursor()
+        self._cantidad_lectores = max(1, lectores)
+        self._lectores = queue.SimpleQueue()
+        for _ in range(self._cantidad_lectores):
+            self._lectores.put(self._conectar())
+        self._bloqueo = threading.RLock()
+
+        # Caché de productos por id, cargada al primer uso y actualizada por
+        # las escrituras de esta instancia. PRAGMA data_version del escritor
+        # cambia solo cuando otra conexión (otra terminal) confirma cambios.
+        self._cache_productos = None
+        self._ids_por_sku = {}
+        self._version_datos = None
+        self._secuencia_cache = 0
+        # Cambia con cada escritura en la caché; ver buscar_por_sku
+        self._generacion_cache = 0
+        self.cache_aciertos = 0
+        self.cache_fallos = 0
+        self.cache_refrescos = 0
+
+        # Commit agrupado: las escrituras se aplican en una transacción abierta
+        # y se confirman juntas cada intervalo_commit_ms o cada
+        # max_operaciones_commit operaciones. intervalo_commit_ms es la
+        # ventana máxima de escrituras que se pierden ante un corte de energía.
+        self._commit_agrupado = commit_agrupado
+        self._intervalo_commit = intervalo_commit_ms / 1000
+        self._max_operaciones_commit = max_operaciones_commit
+        self._operaciones_pendientes = 0
+        # Hay una transacción del grupo sin confirmar; se lee sin el bloqueo
+        self._escrituras_pendientes = False
+        self._detener = threading.Event()
+        self._hilo_commit = None
+        self._abierta = True
+        self._fts_disponible = None
+        self._movimientos_sin_revisar = 0
+        self._hilo_instantanea = None
         self.crear_tablas()
+        self._tomar_instantanea_si_corresponde()
+        if commit_agrupado:
+            self._hilo_commit = threading.Thread(
+                target=self._ciclo_commit_agrupado,
+                name='commit-agrupado',
+                daemon=True,
+            )
+            self._hilo_commit.start()
+            atexit.register(self.cerrar)
 
-    
+    def _conectar(self, isolation_level=''):
+        conn = sqlite3.connect(
+            self.ruta,
+            timeout=TIEMPO_ESPERA_BLOQUEO,
+            isolation_level=isolation_level,
+            check_same_thread=False,
+            factory=ConexionMedida,
+        )
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute('PRAGMA cache_size = -16000')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        return conn
+
+    @contextmanager
+    def _lector(self):
+        # Con escrituras pendientes del commit agrupado se lee desde el
+        # escritor, que es el único que ve esos cambios. Fuera de ese caso
+        # las lecturas no toman el bloqueo y no esperan a una escritura
+        # larga (una importación, un archivado) de esta misma terminal.
+        if self._commit_agrupado and self._escrituras_pendientes:
+            with self._bloqueo:
+                if self.conn.in_transaction:
+                    yield self.conn.cursor()
+                    return
+        conn = self._lectores.get()
+        try:
+            yield conn.cursor()
+        finally:
+            self._lectores.put(conn)
+
+    @sincronizado
+    def _productos_en_cache(self):
+        # La versión se lee antes que los datos: un commit que llegue en el
+        # medio vuelve a marcar la caché como vieja en la próxima lectura
+        version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+        if self._cache_productos is None:
+            self.cache_fallos += 1
+            self._cargar_cache()
+        elif version != self._version_datos:
+            self.cache_refrescos += 1
+            self._refrescar_cache()
+        else:
+            self.cache_aciertos += 1
+        self._version_datos = version
+        return self._cache_productos
+
+    def _cargar_cache(self):
+        self._generacion_cache += 1
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT COALESCE(MAX(secuencia), 0) FROM productos_cambios')
+        self._secuencia_cache = cursor.fetchone()[0]
+        cursor.row_factory = fila_a_producto
+        cursor.execute('SELECT * FROM productos ORDER BY id')
+        self._cache_productos = {producto.id: producto for producto in cursor}
+        self._ids_por_sku = {
+            producto.sku: producto.id
+            for producto in self._cache_productos.values()
+            if producto.sku
+        }
+
+    def _refrescar_cache(self):
+        # Otra conexión confirmó cambios: productos_cambios dice qué
+        # productos tocó desde la última lectura y solo esos se releen
+        cursor = self.conn.cursor()
+        cursor.execute(
+            'SELECT producto_id, secuencia FROM productos_cambios WHERE secuencia > ?',
+            (self._secuencia_cache,)
+        )
+        cambios = cursor.fetchall()
+        if not cambios:
+            return
+        if len(cambios) > len(self._cache_productos) // 2:
+            # Con medio catálogo cambiado sale más barato leerlo entero
+            self._cargar_cache()
+            return
+        self._secuencia_cache = max(secuencia for _, secuencia in cambios)
+        ids = [id for id, _ in cambios]
+        cursor.row_factory = fila_a_producto
+        for inicio in range(0, len(ids), TAMANO_LOTE_CACHE):
+            lote = ids[inicio:inicio + TAMANO_LOTE_CACHE]
+            cursor.execute(
+                f"SELECT * FROM productos WHERE id IN ({', '.join('?' * len(lote))})",
+                lote
+            )
+            vigentes = {producto.id: producto for producto in cursor.fetchall()}
+            for id in lote:
+                if id in vigentes:
+                    self._cachear(vigentes[id])
+                else:
+                    self._descachear(id)
+
+    def _cachear(self, producto):
+        if self._cache_productos is not None:
+            self._descachear(producto.id)
+            self._cache_productos[producto.id] = producto
+            if producto.sku:
+                self._ids_por_sku[producto.sku] = producto.id
+
+    def _descachear(self, id):
+        if self._cache_productos is not None:
+            self._generacion_cache += 1
+            producto = self._cache_productos.pop(id, None)
+            # El código pudo pasar a otro producto que ya está en el mapa
+            if producto is not None and self._ids_por_sku.get(producto.sku) == id:
+                del self._ids_por_sku[producto.sku]
+
+    def invalidar_cache(self):
+        self._cache_productos = None
+
+    def estadisticas_cache(self):
+        consultas = self.cache_aciertos + self.cache_fallos + self.cache_refrescos
+        return {
+            'aciertos': self.cache_aciertos,
+            'fallos': self.cache_fallos,
+            'refrescos': self.cache_refrescos,
+            'tasa_aciertos': self.cache_aciertos / consultas if consultas else 0.0,
+            'productos': len(self._cache_productos or ()),
+        }
+
+    def _ciclo_commit_agrupado(self):
+        while not self._detener.wait(self._intervalo_commit):
+            self.confirmar_pendientes()
+
+    @sincronizado
+    def confirmar_pendientes(self):
+        if self.conn.in_transaction:
+            self.conn.commit()
+        self._operaciones_pendientes = 0
+        self._escrituras_pendientes = False
+
+    def cerrar(self):
+        # Confirma sincrónicamente lo pendiente antes de cerrar la conexión
+        atexit.unregister(self.cerrar)
+        if self._hilo_commit is not None:
+            self._detener.set()
+            self._hilo_commit.join()
+            self._hilo_commit = None
+        if self._hilo_instantanea is not None:
+            self._hilo_instantanea.join()
+        with self._bloqueo:
+            if self._abierta:
+                self.confirmar_pendientes()
+                self.conn.close()
+                # Espera a que las lectoras en uso vuelvan al pool
+                for _ in range(self._cantidad_lectores):
+                    self._lectores.get().close()
+                self._abierta = False
+
+    @contextmanager
+    def _transaccion(self):
+        with self._bloqueo:
+            if not self._commit_agrupado:
+                # BEGIN explícito: el implícito de sqlite3 llega recién con
+                # el primer INSERT o UPDATE, y un SELECT anterior podría ver
+                # un stock que otra terminal cambia antes de esa escritura
+                if not self.conn.in_transaction:
+                    self.cursor.execute('BEGIN IMMEDIATE')
+                try:
+                    yield self.cursor
+                    self.conn.commit()
+                except Exception:
+                    self.conn.rollback()
+                    raise
+                return
+            # Cada operación va en un savepoint dentro de la transacción del
+            # grupo: si falla se deshace solo ella y no las que esperan commit
+            if not self.conn.in_transaction:
+                self.cursor.execute('BEGIN IMMEDIATE')
+                self._escrituras_pendientes = True
+            self.cursor.execute('SAVEPOINT operacion')
+            try:
+                yield self.cursor
+            except Exception:
+                self.cursor.execute('ROLLBACK TO operacion')
+                raise
+            finally:
+                self.cursor.execute('RELEASE operacion')
+            self._operaciones_pendientes += 1
+            if self._operaciones_pendientes >= self._max_operaciones_commit:
+                self.confirmar_pendientes()
+
+
+    # Migraciones del esquema en orden. La versión guardada en
+    # PRAGMA user_version es la cantidad de migraciones aplicadas, así que
+    # las nuevas solo se agregan al final de la lista.
+    MIGRACIONES = (
+        '_migracion_esquema_base',
+        '_migracion_resumenes_ventas',
+        '_migracion_valor_inventario',
+        '_migracion_indice_busqueda',
+        '_migracion_sku',
+        '_migracion_indice_analitica',
+        '_migracion_movimientos',
+        '_migracion_cambios_productos',
+        '_migracion_instantaneas_parciales',
+    )
+
+    @sincronizado
     def crear_tablas(self):
-    # Verifica si la columna metodo_pago existe en la tabla ventas
-        self.cursor.execute("PRAGMA table_info(ventas)")
-        columns = [col[1] for col in self.cursor.fetchall()]
-        if 'metodo_pago' not in columns:
-            print("Recreando la tabla 'ventas' para agregar la columna 'metodo_pago'")
-            self.cursor.execute("DROP TABLE IF EXISTS ventas")
-        
-        # Crea las tablas
+        # Con una base al día el arranque es una sola lectura del pragma
+        self.cursor.execute('PRAGMA user_version')
+        version = self.cursor.fetchone()[0]
+        if version < len(self.MIGRACIONES):
+            self.migrar(version)
+
+    def migrar(self, version):
+        # Cada migración corre en su propia transacción junto con el cambio
+        # de user_version: si falla, la base queda en la versión anterior.
+        for numero, nombre in enumerate(
+            self.MIGRACIONES[version:], start=version + 1
+        ):
+            self.cursor.execute('BEGIN IMMEDIATE')
+            try:
+                # Otra caja pudo migrar mientras esperábamos el bloqueo
+                self.cursor.execute('PRAGMA user_version')
+                if self.cursor.fetchone()[0] >= numero:
+                    self.conn.rollback()
+                    continue
+                print(f"Aplicando migración {numero}: {nombre}")
+                getattr(self, nombre)()
+                self.cursor.execute(f'PRAGMA user_version = {numero}')
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+
+    def _columnas(self, tabla):
+        self.cursor.execute(f'PRAGMA table_info({tabla})')
+        return [col[1] for col in self.cursor.fetchall()]
+
+    def _copiar_en_lotes(self, origen, destino, columnas, tamano_lote=TAMANO_LOTE_MIGRACION):
+        # Copia por rangos de id con INSERT ... SELECT: las filas nunca pasan
+        # por Python y cada sentencia toca como mucho `tamano_lote` filas
+        lista = ', '.join(columnas)
+        ultimo_id = 0
+        while True:
+            self.cursor.execute(f'''
+                INSERT INTO {destino} ({lista})
+                SELECT {lista} FROM {origen}
+                WHERE id > ? ORDER BY id LIMIT ?
+            ''', (ultimo_id, tamano_lote))
+            if self.cursor.rowcount < tamano_lote:
+                break
+            self.cursor.execute(f'SELECT MAX(id) FROM {destino}')
+            ultimo_id = self.cursor.fetchone()[0]
+
+    def _migracion_esquema_base(self):
         self.cursor.execute('''
             CREATE TABLE IF NOT EXISTS productos (
                 id INTEGER PRIMARY KEY,
@@ -35,6 +472,11 @@ class InventarioCajaApp:
                 cantidad INTEGER NOT NULL
             )
         ''')
+        columnas_ventas = self._columnas('ventas')
+        if columnas_ventas and 'metodo_pago' not in columnas_ventas:
+            # Bases anteriores a metodo_pago: se reconstruye la tabla
+            # conservando las ventas en lugar de borrarla
+            self.cursor.execute('ALTER TABLE ventas RENAME TO ventas_anterior')
         self.cursor.execute('''
             CREATE TABLE IF NOT EXISTS ventas (
                 id INTEGER PRIMARY KEY,
@@ -46,130 +488,1237 @@ class InventarioCajaApp:
                 FOREIGN KEY (producto_id) REFERENCES productos (id)
             )
         ''')
-        self.conn.commit()
+        if columnas_ventas and 'metodo_pago' not in columnas_ventas:
+            self._copiar_en_lotes(
+                'ventas_anterior',
+                'ventas',
+                [col for col in self._columnas('ventas') if col in columnas_ventas],
+            )
+            self.cursor.execute('DROP TABLE ventas_anterior')
+        self.cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_ventas_fecha ON ventas (fecha)'
+        )
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ventas_metodo_fecha
+            ON ventas (metodo_pago, fecha, total)
+        ''')
+
+    def _migracion_resumenes_ventas(self):
+        # Resúmenes de ventas mantenidos por trigger en la misma transacción
+        # que cada INSERT, para no reagregar todo el historial en cada refresco
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS resumen_diario (
+                dia TEXT NOT NULL,
+                metodo_pago TEXT NOT NULL,
+                ventas INTEGER NOT NULL,
+                total REAL NOT NULL,
+                unidades INTEGER NOT NULL,
+                PRIMARY KEY (dia, metodo_pago)
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS resumen_metodo_pago (
+                metodo_pago TEXT PRIMARY KEY,
+                ventas INTEGER NOT NULL,
+                total REAL NOT NULL,
+                unidades INTEGER NOT NULL
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_ventas_resumen
+            AFTER INSERT ON ventas
+            BEGIN
+                INSERT INTO resumen_diario (dia, metodo_pago, ventas, total, unidades)
+                VALUES (
+                    substr(NEW.fecha, 1, 10), COALESCE(NEW.metodo_pago, ''),
+                    1, COALESCE(NEW.total, 0), COALESCE(NEW.cantidad, 0)
+                )
+                ON CONFLICT (dia, metodo_pago) DO UPDATE SET
+                    ventas = ventas + 1,
+                    total = total + excluded.total,
+                    unidades = unidades + excluded.unidades;
+                INSERT INTO resumen_metodo_pago (metodo_pago, ventas, total, unidades)
+                VALUES (
+                    COALESCE(NEW.metodo_pago, ''),
+                    1, COALESCE(NEW.total, 0), COALESCE(NEW.cantidad, 0)
+                )
+                ON CONFLICT (metodo_pago) DO UPDATE SET
+                    ventas = ventas + 1,
+                    total = total + excluded.total,
+                    unidades = unidades + excluded.unidades;
+            END
+        ''')
+        self._recalcular_resumenes(self.cursor)
 
-    
-    
-    def agregar_producto(self, nombre, precio, cantidad):
+    def _migracion_valor_inventario(self):
+        # Valorización de inventario por banda de precio, mantenida por
+        # triggers en cada alta, baja, edición o venta de productos
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS valor_inventario (
+                banda INTEGER PRIMARY KEY,
+                productos INTEGER NOT NULL,
+                unidades INTEGER NOT NULL,
+                valor REAL NOT NULL
+            )
+        ''')
+        sumar = '''
+            INSERT INTO valor_inventario (banda, productos, unidades, valor)
+            VALUES ({banda}, 1, NEW.cantidad, NEW.precio * NEW.cantidad)
+            ON CONFLICT (banda) DO UPDATE SET
+                productos = productos + 1,
+                unidades = unidades + excluded.unidades,
+                valor = valor + excluded.valor;
+        '''.format(banda=expresion_banda('NEW.precio'))
+        restar = '''
+            UPDATE valor_inventario SET
+                productos = productos - 1,
+                unidades = unidades - OLD.cantidad,
+                valor = valor - OLD.precio * OLD.cantidad
+            WHERE banda = {banda};
+        '''.format(banda=expresion_banda('OLD.precio'))
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_productos_valor_insert
+            AFTER INSERT ON productos
+            BEGIN {sumar} END
+        ''')
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_productos_valor_delete
+            AFTER DELETE ON productos
+            BEGIN {restar} END
+        ''')
+        self.cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_productos_valor_update
+            AFTER UPDATE OF precio, cantidad ON productos
+            BEGIN {restar} {sumar} END
+        ''')
+        self._recalcular_valor_inventario(self.cursor)
+
+    def _migracion_indice_busqueda(self):
+        # Índice FTS5 sobre productos.nombre sin distinguir acentos ni
+        # mayúsculas. Si esta compilación de SQLite no trae FTS5 la búsqueda
+        # vuelve a un LIKE sobre la tabla.
         try:
-            self.cursor.execute(
-                'INSERT INTO productos (nombre, precio, cantidad) VALUES (?, ?, ?)',
-                (nombre, precio, cantidad)
+            self.cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS productos_fts USING fts5(
+                    nombre,
+                    content='productos',
+                    content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            ''')
+        except sqlite3.OperationalError as e:
+            print(f"Búsqueda de texto completo no disponible: {e}")
+            return
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_productos_fts_insert
+            AFTER INSERT ON productos
+            BEGIN
+                INSERT INTO productos_fts (rowid, nombre) VALUES (NEW.id, NEW.nombre);
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_productos_fts_delete
+            AFTER DELETE ON productos
+            BEGIN
+                INSERT INTO productos_fts (productos_fts, rowid, nombre)
+                VALUES ('delete', OLD.id, OLD.nombre);
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_productos_fts_update
+            AFTER UPDATE OF nombre ON productos
+            BEGIN
+                INSERT INTO productos_fts (productos_fts, rowid, nombre)
+                VALUES ('delete', OLD.id, OLD.nombre);
+                INSERT INTO productos_fts (rowid, nombre) VALUES (NEW.id, NEW.nombre);
+            END
+        ''')
+        self.cursor.execute(
+            "INSERT INTO productos_fts (productos_fts) VALUES ('rebuild')"
+        )
+
+    def _migracion_sku(self):
+        if 'sku' not in self._columnas('productos'):
+            self.cursor.execute('ALTER TABLE productos ADD COLUMN sku TEXT')
+        self.cursor.execute(
+            'CREATE UNIQUE INDEX IF NOT EXISTS idx_productos_sku ON productos (sku)'
+        )
+
+    def _migracion_indice_analitica(self):
+        # Índice de cobertura para los reportes de analitica.py: fecha,
+        # producto, cantidad y total se leen del índice sin tocar la tabla.
+        # Reemplaza a idx_ventas_fecha, que es un prefijo suyo.
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ventas_fecha_producto
+            ON ventas (fecha, producto_id, cantidad, total)
+        ''')
+        self.cursor.execute('DROP INDEX IF EXISTS idx_ventas_fecha')
+
+    def _migracion_movimientos(self):
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS movimientos (
+                id INTEGER PRIMARY KEY,
+                producto_id INTEGER NOT NULL,
+                fecha TEXT NOT NULL,
+                tipo TEXT NOT NULL,
+                cantidad INTEGER NOT NULL,
+                precio REAL NOT NULL
             )
-            self.conn.commit()
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_movimientos_producto
+            ON movimientos (producto_id, id)
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS instantaneas (
+                id INTEGER PRIMARY KEY,
+                fecha TEXT NOT NULL,
+                ultimo_movimiento INTEGER NOT NULL
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS instantaneas_stock (
+                instantanea_id INTEGER NOT NULL,
+                producto_id INTEGER NOT NULL,
+                cantidad INTEGER NOT NULL,
+                precio REAL NOT NULL,
+                PRIMARY KEY (instantanea_id, producto_id)
+            ) WITHOUT ROWID
+        ''')
+        # El historial empieza aquí: la primera instantánea es el stock actual
+        self.cursor.execute('''
+            INSERT INTO instantaneas (fecha, ultimo_movimiento)
+            SELECT ?, COALESCE(MAX(id), 0) FROM movimientos
+        ''', (datetime.now().strftime(FORMATO_FECHA),))
+        self.cursor.execute('''
+            INSERT INTO instantaneas_stock (instantanea_id, producto_id, cantidad, precio)
+            SELECT ?, id, cantidad, precio FROM productos
+        ''', (self.cursor.lastrowid,))
+
+    def _migracion_cambios_productos(self):
+        # Última secuencia en la que cambió cada producto, mantenida por
+        # triggers. La caché de productos la usa para releer solo lo que otra
+        # terminal modificó en lugar del catálogo completo.
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS productos_cambios (
+                producto_id INTEGER PRIMARY KEY,
+                secuencia INTEGER NOT NULL
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_productos_cambios_secuencia
+            ON productos_cambios (secuencia)
+        ''')
+        anotar = '''
+            INSERT INTO productos_cambios (producto_id, secuencia)
+            VALUES ({id}, (SELECT COALESCE(MAX(secuencia), 0) + 1 FROM productos_cambios))
+            ON CONFLICT (producto_id) DO UPDATE SET secuencia = excluded.secuencia;
+        '''
+        for evento, fila in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+            self.cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_productos_cambios_{evento.lower()}
+                AFTER {evento} ON productos
+                BEGIN {anotar.format(id=f'{fila}.id')} END
+            ''')
+
+    def _migracion_instantaneas_parciales(self):
+        # base es la última instantánea completa sobre la que se apoya cada
+        # una; las anteriores a esta migración son todas completas
+        self.cursor.execute(
+            'ALTER TABLE instantaneas ADD COLUMN base INTEGER NOT NULL DEFAULT 0'
+        )
+        self.cursor.execute('UPDATE instantaneas SET base = id')
+
+    def _recalcular_valor_inventario(self, cursor):
+        cursor.execute('DELETE FROM valor_inventario')
+        cursor.execute(f'''
+            INSERT INTO valor_inventario (banda, productos, unidades, valor)
+            SELECT {expresion_banda('precio')}, COUNT(*), SUM(cantidad),
+                   SUM(precio * cantidad)
+            FROM productos
+            GROUP BY 1
+        ''')
+
+    @sincronizado
+    def reconstruir_valor_inventario(self):
+        try:
+            with self._transaccion() as cursor:
+                self._recalcular_valor_inventario(cursor)
             return True
+        except sqlite3.Error as e:
+            print(f"Error al reconstruir el valor del inventario: {e}")
+            return False
+
+    
+    
+    @sincronizado
+    def agregar_producto(self, nombre, precio, cantidad, sku=None):
+        try:
+            fecha = datetime.now().strftime(FORMATO_FECHA)
+            with self._transaccion() as cursor:
+                cursor.execute(
+                    'INSERT INTO productos (nombre, precio, cantidad, sku) VALUES (?, ?, ?, ?)',
+                    (nombre, precio, cantidad, sku)
+                )
+                id = cursor.lastrowid
+                cursor.execute(INSERTAR_MOVIMIENTO, (id, fecha, 'alta', cantidad, precio))
+            self._cachear(Producto(id, nombre, precio, cantidad, sku))
+            self._contar_movimientos(1)
+            return id
         except sqlite3.Error:
             return False
 
-    def actualizar_producto(self, id, nombre, precio, cantidad):
+    @sincronizado
+    def actualizar_producto(self, id, nombre, precio, cantidad, sku=SIN_CAMBIO):
+        # Sin sku se conserva el código actual; sku=None lo borra
         try:
-            self.cursor.execute(
-                'UPDATE productos SET nombre = ?, precio = ?, cantidad = ? WHERE id = ?',
-                (nombre, precio, cantidad, id)
-            )
-            self.conn.commit()
+            fecha = datetime.now().strftime(FORMATO_FECHA)
+            with self._transaccion() as cursor:
+                # El ajuste se anota antes del UPDATE para conocer la diferencia
+                cursor.execute('''
+                    INSERT INTO movimientos (producto_id, fecha, tipo, cantidad, precio)
+                    SELECT id, ?, 'ajuste', ? - cantidad, ? FROM productos
+                    WHERE id = ? AND (cantidad != ? OR precio != ?)
+                ''', (fecha, cantidad, precio, id, cantidad, precio))
+                movimientos = cursor.rowcount
+                if sku is SIN_CAMBIO:
+                    cursor.execute(
+                        'UPDATE productos SET nombre = ?, precio = ?, cantidad = ? '
+                        'WHERE id = ?',
+                        (nombre, precio, cantidad, id)
+                    )
+                else:
+                    cursor.execute(
+                        'UPDATE productos SET nombre = ?, precio = ?, cantidad = ?, sku = ? '
+                        'WHERE id = ?',
+                        (nombre, precio, cantidad, sku, id)
+                    )
+                actualizado = cursor.rowcount > 0
+                if actualizado and sku is SIN_CAMBIO:
+                    cursor.execute('SELECT sku FROM productos WHERE id = ?', (id,))
+                    sku = cursor.fetchone()[0]
+            if actualizado:
+                self._cachear(Producto(id, nombre, precio, cantidad, sku))
+            self._contar_movimientos(movimientos)
             return True
         except sqlite3.Error:
             return False
 
+    @sincronizado
     def eliminar_producto(self, id):
         try:
-            self.cursor.execute('DELETE FROM productos WHERE id = ?', (id,))
-            self.conn.commit()
+            fecha = datetime.now().strftime(FORMATO_FECHA)
+            with self._transaccion() as cursor:
+                cursor.execute('''
+                    INSERT INTO movimientos (producto_id, fecha, tipo, cantidad, precio)
+                    SELECT id, ?, 'baja', -cantidad, precio FROM productos WHERE id = ?
+                ''', (fecha, id))
+                movimientos = cursor.rowcount
+                cursor.execute('DELETE FROM productos WHERE id = ?', (id,))
+            self._descachear(id)
+            self._contar_movimientos(movimientos)
             return True
         except sqlite3.Error:
             return False
 
     def obtener_productos(self):
         try:
-            self.cursor.execute('SELECT * FROM productos')
-            return [Producto(*row) for row in self.cursor.fetchall()]
+            return list(self._productos_en_cache().values())
+        except sqlite3.Error:
+            return []
+
+    def obtener_producto(self, id):
+        try:
+            return self._productos_en_cache().get(id)
+        except sqlite3.Error:
+            return None
+
+    def obtener_productos_por_ids(self, ids):
+        # Varias lecturas del mapa en memoria con una sola verificación de
+        # data_version; los ids inexistentes se omiten
+        try:
+            cache = self._productos_en_cache()
+            return [cache[id] for id in ids if id in cache]
         except sqlite3.Error:
             return []
 
+    def buscar_por_sku(self, sku):
+        # Con la caché al día es una lectura del mapa en memoria. Si está
+        # vieja o el código no figura, se busca en idx_productos_sku y se
+        # cachea solo esa fila: el escáner no espera a refrescar la caché.
+        try:
+            with self._bloqueo:
+                if self._cache_productos is not None:
+                    version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+                    id = self._ids_por_sku.get(sku)
+                    if version == self._version_datos and id is not None:
+                        self.cache_aciertos += 1
+                        return self._cache_productos[id]
+                generacion = self._generacion_cache
+            with self._lector() as cursor:
+                cursor.row_factory = fila_a_producto
+                cursor.execute('SELECT * FROM productos WHERE sku = ?', (sku,))
+                producto = cursor.fetchone()
+            if producto is not None:
+                with self._bloqueo:
+                    # Si esta instancia escribió en la caché mientras se
+                    # leía, su versión del producto puede ser más nueva
+                    if generacion == self._generacion_cache:
+                        self._cachear(producto)
+            return producto
+        except sqlite3.Error:
+            return None
+
+    def obtener_productos_pagina(self, despues_de_id=0, limite=TAMANO_PAGINA):
+        # Paginación por clave: usa la PK en lugar de OFFSET, que recorre
+        # todas las filas anteriores en cada página
+        try:
+            with self._lector() as cursor:
+                cursor.row_factory = fila_a_producto
+                cursor.execute(
+                    'SELECT * FROM productos WHERE id > ? ORDER BY id LIMIT ?',
+                    (despues_de_id, limite)
+                )
+                return cursor.fetchall()
+        except sqlite3.Error:
+            return []
+
+    def iterar_productos(self, tamano_lote=1000):
+        # Recorre la tabla por lotes de clave sin armar la lista completa ni
+        # retener el bloqueo de lectura entre un lote y el siguiente
+        ultimo_id = 0
+        while True:
+            lote = self.obtener_productos_pagina(ultimo_id, tamano_lote)
+            yield from lote
+            if len(lote) < tamano_lote:
+                return
+            ultimo_id = lote[-1].id
+
+    def buscar_productos(self, texto, limite=LIMITE_BUSQUEDA):
+        # Cada palabra se busca como prefijo; los resultados se ordenan por
+        # relevancia (bm25) y solo se devuelven los primeros `limite`
+        palabras = re.findall(r'\w+', texto)
+        if not palabras:
+            return []
+        try:
+            with self._lector() as cursor:
+                if self._fts_disponible is None:
+                    cursor.execute(
+                        "SELECT 1 FROM sqlite_master WHERE name = 'productos_fts'"
+                    )
+                    self._fts_disponible = cursor.fetchone() is not None
+                cursor.row_factory = fila_a_producto
+                if self._fts_disponible:
+                    cursor.execute('''
+                        SELECT p.* FROM productos_fts
+                        JOIN productos p ON p.id = productos_fts.rowid
+                        WHERE productos_fts MATCH ?
+                        ORDER BY productos_fts.rank
+                        LIMIT ?
+                    ''', (' '.join(f'"{palabra}"*' for palabra in palabras), limite))
+                else:
+                    cursor.execute(
+                        'SELECT * FROM productos WHERE nombre LIKE ? LIMIT ?',
+                        (f'%{texto.strip()}%', limite)
+                    )
+                return cursor.fetchall()
+        except sqlite3.Error:
+            return []
+
+    @sincronizado
     def registrar_venta(self, producto_id, cantidad, total, metodo_pago):
         try:
-            fecha = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            self.cursor.execute('''
-                INSERT INTO ventas (producto_id, cantidad, total, metodo_pago, fecha)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (producto_id, cantidad, total, metodo_pago, fecha))
-            self.conn.commit()
+            fecha = datetime.now().strftime(FORMATO_FECHA)
+            with self._transaccion() as cursor:
+                cursor.execute('''
+                    INSERT INTO ventas (producto_id, cantidad, total, metodo_pago, fecha)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (producto_id, cantidad, total, metodo_pago, fecha))
             return True
         except sqlite3.Error as e:
             print(f"Error al registrar la venta: {e}")
             return False
 
-    def obtener_totales_por_metodo_pago(self):
+    @sincronizado
+    def registrar_ticket(self, lineas, metodo_pago):
+        # Registra todas las líneas (producto_id, cantidad) de un ticket en una
+        # sola transacción. El stock se descuenta de forma condicional en la
+        # base de datos, así dos cajas no pueden vender la misma unidad.
+        cantidades = {}
+        for producto_id, cantidad in lineas:
+            if cantidad <= 0:
+                return False
+            cantidades[producto_id] = cantidades.get(producto_id, 0) + cantidad
+        if not cantidades:
+            return False
+        fecha = datetime.now().strftime(FORMATO_FECHA)
         try:
-            self.cursor.execute(
-                'SELECT metodo_pago, SUM(total) FROM ventas GROUP BY metodo_pago'
-            )
-            return {metodo_pago: total for metodo_pago, total in self.cursor.fetchall()}
+            with self._transaccion() as cursor:
+                cursor.executemany(
+                    'UPDATE productos SET cantidad = cantidad - ? '
+                    'WHERE id = ? AND cantidad >= ?',
+                    [(c, id, c) for id, c in cantidades.items()]
+                )
+                if cursor.rowcount != len(cantidades):
+                    raise sqlite3.IntegrityError('Stock insuficiente')
+                marcadores = ', '.join('?' * len(cantidades))
+                cursor.execute(
+                    f'SELECT id, precio FROM productos WHERE id IN ({marcadores})',
+                    list(cantidades)
+                )
+                precios = dict(cursor.fetchall())
+                cursor.executemany('''
+                    INSERT INTO ventas (producto_id, cantidad, total, metodo_pago, fecha)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', [
+                    (id, c, precios[id] * c, metodo_pago, fecha)
+                    for id, c in cantidades.items()
+                ])
+                cursor.executemany(INSERTAR_MOVIMIENTO, [
+                    (id, fecha, 'venta', -c, precios[id])
+                    for id, c in cantidades.items()
+                ])
+            if self._cache_productos is not None:
+                for id, c in cantidades.items():
+                    producto = self._cache_productos.get(id)
+                    if producto is not None:
+                        self._cachear(Producto(
+                            id,
+                            producto.nombre,
+                            producto.precio,
+                            producto.cantidad - c,
+                            producto.sku,
+                        ))
+            self._contar_movimientos(len(cantidades))
+            return True
+        except sqlite3.Error as e:
+            print(f"Error al registrar el ticket: {e}")
+            return False
+
+    def obtener_totales_por_metodo_pago(self, desde=None, hasta=None):
+        try:
+            if desde is None and hasta is None:
+                with self._lector() as cursor:
+                    cursor.execute(
+                        'SELECT metodo_pago, total FROM resumen_metodo_pago'
+                    )
+                    return {metodo_pago: total for metodo_pago, total in cursor.fetchall()}
+            totales = {}
+            for metodo_pago, total in self._consultar_ventas(
+                CONSULTA_TOTALES_METODO_RANGO, desde or '', hasta or '9999'
+            ):
+                totales[metodo_pago] = totales.get(metodo_pago, 0) + total
+            return totales
         except sqlite3.Error:
             return {}
 
-    def obtener_cuadre_caja(self):
+    def obtener_cuadre_caja(self, dia=None):
+        try:
+            with self._lector() as cursor:
+                cursor.execute(
+                    'SELECT SUM(total) FROM resumen_diario WHERE dia = ?',
+                    ((dia or date.today()).isoformat(),)
+                )
+                return cursor.fetchone()[0] or 0
+        except sqlite3.Error:
+            return 0
+
+    def obtener_total_ventas(self, desde, hasta):
+        try:
+            return sum(
+                total or 0
+                for total, in self._consultar_ventas(CONSULTA_TOTAL_RANGO, desde, hasta)
+            )
+        except sqlite3.Error:
+            return 0
+
+    def _consultar_ventas(self, consulta, desde, hasta):
+        # Consulta de rango sobre ventas. Si el rango no toca meses
+        # archivados va directo a la tabla activa; si no, se repite por tramo
+        # sobre la vista que une la tabla activa con los archivos.
+        tramos = self.tramos_historicos(desde, hasta)
+        if not tramos[0][2]:
+            with self._lector() as cursor:
+                cursor.execute(consulta, (desde, hasta))
+                return cursor.fetchall()
+        filas = []
+        for desde_tramo, hasta_tramo, meses in tramos:
+            with self.conexion_historica(meses) as cursor:
+                cursor.execute(consulta, (desde_tramo, hasta_tramo))
+                filas.extend(cursor.fetchall())
+        return filas
+
+    def _ruta_archivo(self, mes=''):
+        return f'{os.path.splitext(self.ruta)[0]}_ventas_{mes}'
+
+    def meses_archivados(self, desde=None, hasta=None):
+        # Meses 'AAAA-MM' archivados que se solapan con [desde, hasta)
+        prefijo = self._ruta_archivo()
+        meses = []
+        for ruta in sorted(glob.glob(glob.escape(prefijo) + '[0-9]*-[0-9]*.db')):
+            mes = ruta[len(prefijo):-len('.db')]
+            if (desde is None or mes >= desde[:7]) and (
+                hasta is None or f'{mes}-01' < hasta
+            ):
+                meses.append(mes)
+        return meses
+
+    def tramos_historicos(self, desde=None, hasta=None):
+        # Divide [desde, hasta) en tramos de como mucho MAX_ARCHIVOS_ADJUNTOS
+        # meses archivados; sin archivos es un solo tramo sobre la tabla activa
+        meses = self.meses_archivados(desde, hasta)
+        tramos = []
+        for i in range(0, max(len(meses), 1), MAX_ARCHIVOS_ADJUNTOS):
+            grupo = meses[i:i + MAX_ARCHIVOS_ADJUNTOS]
+            fin = i + MAX_ARCHIVOS_ADJUNTOS
+            tramos.append((
+                desde if i == 0 else f'{grupo[0]}-01',
+                hasta if fin >= len(meses) else f'{meses[fin]}-01',
+                grupo,
+            ))
+        return tramos
+
+    @contextmanager
+    def conexion_historica(self, meses):
+        # Conexión propia con los meses indicados adjuntos y una vista TEMP
+        # llamada ventas que une la tabla activa con sus archivos. Como las
+        # vistas TEMP tapan a las tablas de main, las consultas de siempre
+        # leen el histórico completo sin cambios.
+        conn = self._conectar()
         try:
+            if meses:
+                partes = [f'SELECT {COLUMNAS_VENTAS} FROM main.ventas']
+                for i, mes in enumerate(meses):
+                    conn.execute(
+                        f'ATTACH DATABASE ? AS archivo_{i}',
+                        (f'{self._ruta_archivo(mes)}.db',)
+                    )
+                    partes.append(f'SELECT {COLUMNAS_VENTAS} FROM archivo_{i}.ventas')
+                conn.execute(f"CREATE TEMP VIEW ventas AS {' UNION ALL '.join(partes)}")
+            yield conn.cursor()
+        finally:
+            conn.close()
+
+    @sincronizado
+    def archivar_ventas(self, antes_de=None):
+        # Mueve las ventas de los meses cerrados (por defecto, todo lo
+        # anterior al mes en curso) a un archivo por mes. Los resúmenes no
+        # tienen trigger de borrado, así que el cuadre y los totales siguen
+        # incluyendo lo archivado. Cada mes se copia con INSERT OR IGNORE
+        # antes de borrarlo: si un corte deja filas en ambos lados, volver a
+        # archivar termina el trabajo sin duplicar.
+        limite = (antes_de or date.today()).replace(day=1).isoformat()
+        try:
+            self.confirmar_pendientes()
             self.cursor.execute(
-                "SELECT SUM(total) FROM ventas WHERE DATE(fecha) = DATE('now')"
+                'SELECT DISTINCT substr(fecha, 1, 7) FROM ventas WHERE fecha < ? ORDER BY 1',
+                (limite,)
             )
-            return self.cursor.fetchone()[0] or 0
+            meses = [mes for mes, in self.cursor.fetchall()]
+            archivadas = 0
+            for mes in meses:
+                rango = (f'{mes}-01', inicio_mes_siguiente(mes))
+                self.cursor.execute(
+                    'ATTACH DATABASE ? AS archivo', (f'{self._ruta_archivo(mes)}.db',)
+                )
+                try:
+                    self.cursor.execute('''
+                        CREATE TABLE IF NOT EXISTS archivo.ventas (
+                            id INTEGER PRIMARY KEY,
+                            producto_id INTEGER,
+                            cantidad INTEGER,
+                            total REAL,
+                            metodo_pago TEXT,
+                            fecha TEXT
+                        )
+                    ''')
+                    self.cursor.execute(
+                        'CREATE INDEX IF NOT EXISTS archivo.idx_ventas_fecha_producto '
+                        'ON ventas (fecha, producto_id, cantidad, total)'
+                    )
+                    self.cursor.execute('BEGIN IMMEDIATE')
+                    try:
+                        self.cursor.execute(f'''
+                            INSERT OR IGNORE INTO archivo.ventas ({COLUMNAS_VENTAS})
+                            SELECT {COLUMNAS_VENTAS} FROM main.ventas
+                            WHERE fecha >= ? AND fecha < ?
+                        ''', rango)
+                        self.cursor.execute(
+                            'DELETE FROM main.ventas WHERE fecha >= ? AND fecha < ?',
+                            rango
+                        )
+                        archivadas += self.cursor.rowcount
+                        self.conn.commit()
+                    except sqlite3.Error:
+                        self.conn.rollback()
+                        raise
+                finally:
+                    self.cursor.execute('DETACH DATABASE archivo')
+            return archivadas
+        except sqlite3.Error as e:
+            print(f"Error al archivar ventas: {e}")
+            return None
+
+    def _recalcular_resumenes(self, cursor, desde=''):
+        cursor.execute('DELETE FROM resumen_diario WHERE dia >= ?', (desde,))
+        cursor.execute('''
+            INSERT INTO resumen_diario (dia, metodo_pago, ventas, total, unidades)
+            SELECT substr(fecha, 1, 10), COALESCE(metodo_pago, ''),
+                   COUNT(*), COALESCE(SUM(total), 0), COALESCE(SUM(cantidad), 0)
+            FROM ventas
+            WHERE fecha >= ?
+            GROUP BY 1, 2
+        ''', (desde,))
+        cursor.execute('DELETE FROM resumen_metodo_pago')
+        cursor.execute('''
+            INSERT INTO resumen_metodo_pago (metodo_pago, ventas, total, unidades)
+            SELECT metodo_pago, SUM(ventas), SUM(total), SUM(unidades)
+            FROM resumen_diario
+            GROUP BY metodo_pago
+        ''')
+
+    @sincronizado
+    def reconstruir_resumenes(self):
+        # Recalcula los resúmenes desde ventas por si se desincronizaron. Los
+        # meses archivados están cerrados y conservan sus filas de resumen.
+        meses = self.meses_archivados()
+        desde = inicio_mes_siguiente(meses[-1]) if meses else ''
+        try:
+            with self._transaccion() as cursor:
+                self._recalcular_resumenes(cursor, desde)
+            return True
+        except sqlite3.Error as e:
+            print(f"Error al reconstruir los resúmenes de ventas: {e}")
+            return False
+
+    def valor_inventario(self):
+        try:
+            with self._lector() as cursor:
+                cursor.execute('SELECT SUM(valor) FROM valor_inventario')
+                return cursor.fetchone()[0] or 0
         except sqlite3.Error:
             return 0
 
+    def valor_inventario_por_banda(self):
+        try:
+            with self._lector() as cursor:
+                cursor.execute('''
+                    SELECT banda, productos, unidades, valor
+                    FROM valor_inventario
+                    WHERE productos > 0
+                    ORDER BY banda
+                ''')
+                return [
+                    (etiqueta_banda(banda), productos, unidades, valor)
+                    for banda, productos, unidades, valor in cursor.fetchall()
+                ]
+        except sqlite3.Error:
+            return []
+
+    def verificar_valor_inventario(self, tolerancia=0.01):
+        # Compara el valor incremental con un SUM completo sobre productos
+        incremental = self.valor_inventario()
+        with self._lector() as cursor:
+            cursor.execute('SELECT SUM(precio * cantidad) FROM productos')
+            recalculado = cursor.fetchone()[0] or 0
+        return incremental, recalculado, abs(incremental - recalculado) <= tolerancia
 
-    def registrar_venta(self, producto_id, cantidad, total, metodo_pago):
+    def _guardar_instantanea(self, cursor):
+        # Una instantánea parcial guarda solo los productos con movimientos
+        # desde la anterior (con cantidad 0 los que se dieron de baja), así
+        # nunca crece más que el kardex. Cuando las parciales desde la última
+        # completa suman tantas filas como el catálogo, se guarda otra
+        # completa y existencias_en no lee más de dos catálogos.
+        cursor.execute('SELECT ultimo_movimiento, base FROM instantaneas ORDER BY id DESC LIMIT 1')
+        anterior = cursor.fetchone()
+        cursor.execute('SELECT COALESCE(MAX(id), 0) FROM movimientos')
+        ultimo_movimiento = cursor.fetchone()[0]
+        completa = anterior is None
+        if not completa:
+            cursor.execute(
+                'SELECT COUNT(*) FROM instantaneas_stock WHERE instantanea_id > ?',
+                (anterior[1],)
+            )
+            acumuladas = cursor.fetchone()[0]
+            cursor.execute('SELECT COUNT(*) FROM productos')
+            completa = acumuladas >= cursor.fetchone()[0]
+        cursor.execute(
+            'INSERT INTO instantaneas (fecha, ultimo_movimiento, base) VALUES (?, ?, ?)',
+            (datetime.now().strftime(FORMATO_FECHA), ultimo_movimiento,
+             0 if completa else anterior[1])
+        )
+        instantanea = cursor.lastrowid
+        if completa:
+            cursor.execute('UPDATE instantaneas SET base = id WHERE id = ?', (instantanea,))
+            cursor.execute('''
+                INSERT INTO instantaneas_stock (instantanea_id, producto_id, cantidad, precio)
+                SELECT ?, id, cantidad, precio FROM productos
+            ''', (instantanea,))
+        else:
+            cursor.execute('''
+                INSERT INTO instantaneas_stock (instantanea_id, producto_id, cantidad, precio)
+                SELECT ?, m.producto_id, COALESCE(p.cantidad, 0), COALESCE(p.precio, m.precio)
+                FROM (
+                    SELECT producto_id, precio, MAX(id) FROM movimientos
+                    WHERE id > ? AND id <= ? GROUP BY producto_id
+                ) AS m
+                LEFT JOIN productos AS p ON p.id = m.producto_id
+            ''', (instantanea, anterior[0], ultimo_movimiento))
+
+    @sincronizado
+    def tomar_instantanea(self):
         try:
-            fecha = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            self.cursor.execute('''
-                INSERT INTO ventas (producto_id, cantidad, total, metodo_pago, fecha)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (producto_id, cantidad, total, metodo_pago, fecha))
-            self.conn.commit()
+            with self._transaccion() as cursor:
+                self._guardar_instantanea(cursor)
             return True
         except sqlite3.Error as e:
-            print(f"Error al registrar la venta: {e}")
+            print(f"Error al guardar la instantánea de stock: {e}")
             return False
 
-    def obtener_totales_por_metodo_pago(self):
+    @sincronizado
+    def _tomar_instantanea_si_corresponde(self):
+        # Revisa en la base (la comparten varias cajas) si desde la última
+        # instantánea se acumularon MOVIMIENTOS_POR_INSTANTANEA movimientos
+        self._movimientos_sin_revisar = 0
+        if not self._abierta:
+            return
         try:
-            self.cursor.execute(
-                'SELECT metodo_pago, SUM(total) FROM ventas GROUP BY metodo_pago'
+            with self._lector() as cursor:
+                cursor.execute('''
+                    SELECT (SELECT COALESCE(MAX(id), 0) FROM movimientos)
+                         - (SELECT COALESCE(MAX(ultimo_movimiento), 0) FROM instantaneas)
+                ''')
+                pendientes = cursor.fetchone()[0]
+        except sqlite3.Error:
+            return
+        if pendientes >= MOVIMIENTOS_POR_INSTANTANEA:
+            self.tomar_instantanea()
+
+    def _contar_movimientos(self, cantidad):
+        # Se llama con el bloqueo tomado, después del commit. La instantánea
+        # corre en su propio hilo: la venta que cruza el umbral no la espera.
+        self._movimientos_sin_revisar += cantidad
+        if self._movimientos_sin_revisar >= MOVIMIENTOS_POR_INSTANTANEA and (
+            self._hilo_instantanea is None or not self._hilo_instantanea.is_alive()
+        ):
+            self._movimientos_sin_revisar = 0
+            self._hilo_instantanea = threading.Thread(
+                target=self._tomar_instantanea_si_corresponde,
+                name='instantanea',
+                daemon=True,
             )
-            return {metodo_pago: total for metodo_pago, total in self.cursor.fetchall()}
+            self._hilo_instantanea.start()
+
+    def existencias_en(self, fecha):
+        # Stock y precio de cada producto justo antes de `fecha`: la última
+        # instantánea anterior más los movimientos que la siguen. El
+        # historial empieza con la migración que creó el kardex.
+        try:
+            with self._lector() as cursor:
+                cursor.execute('''
+                    SELECT id, ultimo_movimiento, base FROM instantaneas
+                    WHERE fecha < ? ORDER BY fecha DESC, id DESC LIMIT 1
+                ''', (fecha,))
+                fila = cursor.fetchone()
+                existencias = {}
+                ultimo_movimiento = 0
+                if fila is not None:
+                    # La completa y las parciales que la siguen, en orden: la
+                    # última fila de cada producto es su stock en la instantánea
+                    instantanea, ultimo_movimiento, base = fila
+                    cursor.execute('''
+                        SELECT producto_id, cantidad, precio FROM instantaneas_stock
+                        WHERE instantanea_id BETWEEN ? AND ? ORDER BY instantanea_id
+                    ''', (base, instantanea))
+                    existencias = {id: [cantidad, precio] for id, cantidad, precio in cursor}
+                cursor.execute('''
+                    SELECT producto_id, cantidad, precio FROM movimientos
+                    WHERE id > ? AND fecha < ? ORDER BY id
+                ''', (ultimo_movimiento, fecha))
+                for id, cantidad, precio in cursor:
+                    existencia = existencias.setdefault(id, [0, precio])
+                    existencia[0] += cantidad
+                    existencia[1] = precio
+                return {id: tuple(existencia) for id, existencia in existencias.items()}
         except sqlite3.Error:
             return {}
 
-    def obtener_cuadre_caja(self):
+    def valor_inventario_en(self, fecha):
+        return sum(
+            cantidad * precio for cantidad, precio in self.existencias_en(fecha).values()
+        )
+
+    def obtener_movimientos(self, producto_id, limite=100):
+        # Kardex de un producto, del movimiento más reciente al más antiguo
         try:
-            self.cursor.execute(
-                "SELECT SUM(total) FROM ventas WHERE DATE(fecha) = DATE('now')"
-            )
-            return self.cursor.fetchone()[0] or 0
+            with self._lector() as cursor:
+                cursor.execute('''
+                    SELECT fecha, tipo, cantidad, precio FROM movimientos
+                    WHERE producto_id = ? ORDER BY id DESC LIMIT ?
+                ''', (producto_id, limite))
+                return cursor.fetchall()
         except sqlite3.Error:
-            return 0
+            return []
+
+    def verificar_existencias(self):
+        # Ids cuyo stock reconstruido desde el kardex no coincide con productos
+        reconstruido = self.existencias_en('9999')
+        actuales = {producto.id: producto.cantidad for producto in self.obtener_productos()}
+        return sorted(
+            id for id in reconstruido.keys() | actuales.keys()
+            if reconstruido.get(id, (0, 0))[0] != actuales.get(id, 0)
+        )
+
+    def explicar_consulta(self, sql, parametros=()):
+        with self._lector() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', parametros)
+            return [row[3] for row in cursor.fetchall()]
+
+    def consultas_con_escaneo_completo(self):
+        # Devuelve las consultas de CONSULTAS_RANGO_VENTAS cuyo plan recorre
+        # ventas entera. Un SCAN sobre un índice cubriente también cuenta:
+        # lee todas las entradas del índice en lugar de buscar el rango.
+        desde, hasta = rango_dia()
+        return [
+            nombre for nombre, sql in CONSULTAS_RANGO_VENTAS.items()
+            if any(
+                paso.startswith('SCAN ventas')
+                for paso in self.explicar_consulta(sql, (desde, hasta))
+            )
+        ]
+
+    @sincronizado
+    def importar_productos_csv(
+        self,
+        filename,
+        sumar_stock=True,
+        progreso=None,
+        tamano_lote=TAMANO_LOTE_IMPORTACION,
+    ):
+        # Importa un CSV con columnas nombre, precio y cantidad (y sku
+        # opcional) leyéndolo por lotes. Los productos que ya existen (por
+        # sku y, si no coincide, por nombre) se actualizan y el resto se
+        # inserta, todo con executemany en una sola transacción.
+        # Con sumar_stock la cantidad del archivo se suma a la existente,
+        # como en la recepción de un pedido; si no, la reemplaza.
+        resultado = {'insertados': 0, 'actualizados': 0, 'rechazados': []}
+        fecha = datetime.now().strftime(FORMATO_FECHA)
+        ids_por_nombre = {}
+        ids_por_sku = {}
+        # Primer nombre con el que aparece cada sku en el archivo
+        nombres_por_sku = {}
+        for producto in self._productos_en_cache().values():
+            ids_por_nombre.setdefault(producto.nombre, producto.id)
+            if producto.sku:
+                ids_por_sku[producto.sku] = producto.id
+        if sumar_stock:
+            sql_actualizar = (
+                'UPDATE productos SET precio = ?, cantidad = cantidad + ?, '
+                'sku = COALESCE(?, sku) WHERE id = ?'
+            )
+        else:
+            sql_actualizar = (
+                'UPDATE productos SET precio = ?, cantidad = ?, '
+                'sku = COALESCE(?, sku) WHERE id = ?'
+            )
+
+        def aplicar_lote(cursor, lote):
+            actualizar = []
+            nuevos = {}
+            for linea, nombre, precio, cantidad, sku in lote:
+                if sku and nombres_por_sku.setdefault(sku, nombre) != nombre:
+                    # Un mismo código con otro nombre es un error del archivo:
+                    # sumarlo al producto anterior perdería uno de los nombres
+                    resultado['rechazados'].append((
+                        linea,
+                        f"sku {sku} repetido con otro nombre ({nombres_por_sku[sku]})",
+                    ))
+                    continue
+                id = ids_por_sku.get(sku) if sku else None
+                if id is None:
+                    id = ids_por_nombre.get(nombre)
+                clave = sku or nombre
+                if id is not None:
+                    actualizar.append((precio, cantidad, sku, id))
+                elif clave in nuevos and sumar_stock:
+                    nuevos[clave] = (nombre, precio, nuevos[clave][2] + cantidad, sku)
+                else:
+                    nuevos[clave] = (nombre, precio, cantidad, sku)
+            # Un producto puede repetirse en el lote: las diferencias del
+            # kardex se calculan en orden a partir del stock actual
+            ids = list({id for _, _, _, id in actualizar})
+            cursor.execute(
+                f"SELECT id, cantidad FROM productos WHERE id IN ({', '.join('?' * len(ids))})",
+                ids
+            )
+            existencias = dict(cursor.fetchall())
+            movimientos = []
+            for precio, cantidad, _, id in actualizar:
+                nueva = existencias[id] + cantidad if sumar_stock else cantidad
+                movimientos.append(
+                    (id, fecha, 'importacion', nueva - existencias[id], precio)
+                )
+                existencias[id] = nueva
+            cursor.executemany(sql_actualizar, actualizar)
+            cursor.executemany(INSERTAR_MOVIMIENTO, movimientos)
+            cursor.execute('SELECT COALESCE(MAX(id), 0) FROM productos')
+            ultimo_id = cursor.fetchone()[0]
+            cursor.executemany(
+                'INSERT INTO productos (nombre, precio, cantidad, sku) VALUES (?, ?, ?, ?)',
+                list(nuevos.values())
+            )
+            cursor.execute('''
+                INSERT INTO movimientos (producto_id, fecha, tipo, cantidad, precio)
+                SELECT id, ?, 'importacion', cantidad, precio FROM productos
+                WHERE id > ?
+            ''', (fecha, ultimo_id))
+            cursor.execute(
+                'SELECT id, nombre, sku FROM productos WHERE id > ?', (ultimo_id,)
+            )
+            for id, nombre, sku in cursor.fetchall():
+                ids_por_nombre.setdefault(nombre, id)
+                if sku:
+                    ids_por_sku[sku] = id
+            for precio, cantidad, sku, id in actualizar:
+                if sku:
+                    ids_por_sku[sku] = id
+            resultado['actualizados'] += len(actualizar)
+            resultado['insertados'] += len(nuevos)
 
-    def generar_reporte_csv(self, filename='reporte_inventario.csv'):
         try:
-            with open(filename, 'w', newline='', encoding='utf-8') as file:
+            with open(filename, newline='', encoding='utf-8-sig') as file, \
+                    self._transaccion() as cursor:
+                lector = csv.DictReader(file)
+                columnas = {
+                    (columna or '').strip().lower(): columna
+                    for columna in lector.fieldnames or []
+                }
+                faltantes = {'nombre', 'precio', 'cantidad'} - set(columnas)
+                if faltantes:
+                    raise ValueError(f"Faltan columnas: {', '.join(sorted(faltantes))}")
+                lote = []
+                leidas = 0
+                for fila in lector:
+                    leidas += 1
+                    try:
+                        nombre = (fila[columnas['nombre']] or '').strip()
+                        precio = float(fila[columnas['precio']])
+                        cantidad = int(fila[columnas['cantidad']])
+                        sku = None
+                        if 'sku' in columnas:
+                            sku = (fila[columnas['sku']] or '').strip() or None
+                        if not nombre or precio <= 0 or cantidad < 0:
+                            raise ValueError('valores fuera de rango')
+                    except (TypeError, ValueError) as e:
+                        # La línea 1 es el encabezado
+                        resultado['rechazados'].append((lector.line_num, str(e)))
+                        continue
+                    lote.append((lector.line_num, nombre, precio, cantidad, sku))
+                    if len(lote) >= tamano_lote:
+                        aplicar_lote(cursor, lote)
+                        lote = []
+                        if progreso:
+                            progreso(leidas, None)
+                if lote:
+                    aplicar_lote(cursor, lote)
+            resultado['rechazados'].sort()
+            self.invalidar_cache()
+            self._contar_movimientos(resultado['insertados'] + resultado['actualizados'])
+            if progreso:
+                progreso(leidas, leidas)
+            return resultado
+        except (IOError, ValueError, sqlite3.Error) as e:
+            print(f"Error al importar productos: {e}")
+            return None
+
+    def generar_reporte_csv(self, filename='reporte_inventario.csv', progreso=None):
+        return self.exportar_csv('productos', filename, progreso=progreso)
+
+    def exportar_csv(
+        self,
+        tipo,
+        filename,
+        desde=None,
+        hasta=None,
+        comprimir=False,
+        progreso=None,
+        tamano_lote=TAMANO_LOTE_EXPORTACION,
+    ):
+        # Exporta productos, ventas o el resumen diario leyendo el cursor por
+        # lotes con fetchmany, así la memoria no depende del tamaño de la
+        # tabla. Usa una conexión propia para no ocupar la lectora mientras
+        # dura la exportación; en WAL no bloquea las ventas. Las ventas se
+        # leen por tramos cronológicos que incluyen los meses archivados.
+        encabezado, consulta, columna_fecha, orden = EXPORTACIONES[tipo]
+
+        def filtrar(desde, hasta):
+            condiciones = []
+            parametros = []
+            if columna_fecha and desde:
+                condiciones.append(f'{columna_fecha} >= ?')
+                parametros.append(desde)
+            if columna_fecha and hasta:
+                condiciones.append(f'{columna_fecha} < ?')
+                parametros.append(hasta)
+            filtro = f" WHERE {' AND '.join(condiciones)}" if condiciones else ''
+            return filtro, parametros
+
+        abrir = gzip.open if comprimir else open
+        try:
+            if tipo == 'ventas':
+                tramos = self.tramos_historicos(desde, hasta)
+            else:
+                tramos = [(desde, hasta, [])]
+            total = None
+            if progreso:
+                total = 0
+                for desde_tramo, hasta_tramo, meses in tramos:
+                    filtro, parametros = filtrar(desde_tramo, hasta_tramo)
+                    with self.conexion_historica(meses) as cursor:
+                        cursor.execute(
+                            f'SELECT COUNT(*) FROM ({consulta}{filtro})', parametros
+                        )
+                        total += cursor.fetchone()[0]
+            hechos = 0
+            with abrir(filename, 'wt', newline='', encoding='utf-8') as file:
                 writer = csv.writer(file)
-                writer.writerow(['ID', 'Nombre', 'Precio', 'Cantidad', 'Valor Total'])
-                for producto in self.obtener_productos():
-                    writer.writerow([
-                        producto.id,
-                        producto.nombre,
-                        producto.precio,
-                        producto.cantidad,
-                        producto.precio * producto.cantidad
-                    ])
+                writer.writerow(encabezado)
+                for desde_tramo, hasta_tramo, meses in tramos:
+                    filtro, parametros = filtrar(desde_tramo, hasta_tramo)
+                    with self.conexion_historica(meses) as cursor:
+                        cursor.execute(
+                            f'{consulta}{filtro} ORDER BY {orden}', parametros
+                        )
+                        while True:
+                            filas = cursor.fetchmany(tamano_lote)
+                            if not filas:
+                                break
+                            writer.writerows(filas)
+                            hechos += len(filas)
+                            if progreso:
+                                progreso(hechos, total)
+            if progreso:
+                progreso(hechos, hechos)
             return True
-        except IOError:
+        except (IOError, sqlite3.Error) as e:
+            print(f"Error al exportar {tipo}: {e}")
             return False
 
 
-def main(page: ft.Page):
-    app = InventarioCajaApp()
+class InventarioAsync:
+    # Fachada asíncrona sobre InventarioCajaApp: cada método se ejecuta en un
+    # pequeño pool de hilos de base de datos y se espera con await, de modo
+    # que las consultas lentas no bloquean el bucle de eventos de Flet
+    def __init__(self, app, hilos=2):
+        self.app = app
+        self._ejecutor = ThreadPoolExecutor(
+            max_workers=hilos,
+            thread_name_prefix='inventario-bd',
+        )
+
+    def __getattr__(self, nombre):
+        metodo = getattr(self.app, nombre)
+
+        async def llamada(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._ejecutor,
+                functools.partial(metodo, *args, **kwargs)
+            )
+        return llamada
+
+    async def con_progreso(self, nombre, al_progresar, *args, **kwargs):
+        # El callback de progreso corre en el hilo de base de datos; se
+        # reenvía al bucle de eventos para que pueda tocar controles
+        loop = asyncio.get_running_loop()
+
+        def progreso(*valores):
+            loop.call_soon_threadsafe(al_progresar, *valores)
+        return await getattr(self, nombre)(*args, progreso=progreso, **kwargs)
+
+    def cerrar(self):
+        self._ejecutor.shutdown(wait=True)
+        self.app.cerrar()
+
+
+def texto_detalle_producto(producto):
+    texto = f"Precio: ${producto.precio:.2f}\nCantidad: {producto.cantidad}"
+    if producto.sku:
+        texto += f"\nSKU: {producto.sku}"
+    return texto
+
+
+def construir_tarjeta(producto, al_editar, al_eliminar, al_vender):
+    titulo = ft.Text(f"{producto.nombre}", size=16, weight="bold")
+    detalle = ft.Text(texto_detalle_producto(producto))
+    return ft.Card(
+        content=ft.Container(
+            content=ft.Column([
+                ft.ListTile(
+                    leading=ft.Icon(icons.SHOPPING_BASKET),
+                    title=titulo,
+                    subtitle=detalle,
+                ),
+                ft.Row([
+                    ft.IconButton(
+                        icons.EDIT,
+                        on_click=lambda _, id=producto.id: al_editar(id)
+                    ),
+                    ft.IconButton(
+                        icons.DELETE,
+                        on_click=lambda _, id=producto.id: al_eliminar(id)
+                    ),
+                    ft.IconButton(
+                        icons.SHOPPING_CART,
+                        on_click=lambda _, id=producto.id: al_vender(id)
+                    )
+                ], alignment=ft.MainAxisAlignment.END)
+            ]),
+            width=250,
+            padding=10,
+        ),
+        data=(titulo, detalle),
+    )
+
+
+def actualizar_tarjeta(tarjeta, producto):
+    # Devuelve solo los textos que cambiaron, para enviarlos en un único update
+    titulo, detalle = tarjeta.data
+    cambiados = []
+    if titulo.value != producto.nombre:
+        titulo.value = producto.nombre
+        cambiados.append(titulo)
+    texto = texto_detalle_producto(producto)
+    if detalle.value != texto:
+        detalle.value = texto
+        cambiados.append(detalle)
+    return cambiados
+
+
+async def main(page: 'ft.Page'):
+    diagnostico.activo = '--diagnostico' in sys.argv
+    medir_actualizaciones(page)
+    app = InventarioCajaApp(commit_agrupado='--commit-agrupado' in sys.argv)
+    datos = InventarioAsync(app)
+    # Los reportes usan su propio hilo para no demorar las ventas
+    reportes = InventarioAsync(
+        Analitica(app, motor='numpy' if '--analitica-numpy' in sys.argv else 'sql'),
+        hilos=1,
+    )
+    # Respaldos en línea: copian desde conexiones propias en otro hilo
+    copias = Respaldos(app)
+    respaldos = InventarioAsync(copias, hilos=1)
+    if '--respaldo-automatico' in sys.argv:
+        copias.iniciar()
+
+    def al_desconectar(e):
+        # Cancela un respaldo en curso antes de esperar a su hilo
+        copias.cerrar()
+        respaldos.cerrar()
+        reportes.cerrar()
+        datos.cerrar()
+
+    page.on_disconnect = al_desconectar
 
     page.title = "Inventario y Cuadre de Caja"
     page.theme_mode = ft.ThemeMode.LIGHT
@@ -183,11 +1732,22 @@ def main(page: ft.Page):
     )
     page.overlay.append(snack_bar)
 
+    # Refresco diferido: los manejadores marcan secciones sucias y controles
+    # modificados, y aplicar_refresco() lo envía todo en un único update
+    refresco = {'secciones': set(), 'productos': set(), 'controles': []}
+
+    def programar_refresco(*secciones, productos=()):
+        refresco['secciones'].update(secciones)
+        refresco['productos'].update(productos)
+
+    def incluir_en_refresco(*controles):
+        refresco['controles'].extend(controles)
+
     def mostrar_toast(mensaje, color=ft.colors.GREEN):
         snack_bar.content = ft.Text(mensaje)
         snack_bar.bgcolor = color
         snack_bar.open = True
-        page.update()
+        incluir_en_refresco(snack_bar)
 
     def cambiar_tema(e):
         page.theme_mode = (
@@ -221,12 +1781,25 @@ def main(page: ft.Page):
         prefix_icon=icons.NUMBERS
     )
 
+    sku_input = ft.TextField(
+        label="SKU / Código de barras",
+        expand=1,
+        prefix_icon=icons.QR_CODE
+    )
+
     buscar_input = ft.TextField(
         label="Buscar producto",
         expand=1,
         prefix_icon=icons.SEARCH
     )
 
+    # Los lectores de código de barras escriben el código y envían Enter
+    escaner_input = ft.TextField(
+        label="Escanear código",
+        expand=1,
+        prefix_icon=icons.QR_CODE_SCANNER
+    )
+
     metodo_pago_dropdown = ft.Dropdown(
         label="Método de Pago",
         options=[
@@ -237,80 +1810,206 @@ def main(page: ft.Page):
         expand=True,
     )
 
-    productos_row = ft.Row(
-        wrap=True,
-        scroll="auto",
+    productos_row = ft.GridView(
         expand=True,
-        alignment=ft.MainAxisAlignment.START,
-        vertical_alignment=ft.CrossAxisAlignment.START,
+        max_extent=270,
+        child_aspect_ratio=1.6,
+        spacing=10,
+        run_spacing=10,
+        on_scroll_interval=100,
     )
+    paginacion = {'ultimo_id': 0, 'hay_mas': True, 'cargados': 0}
+    # Una sola carga de páginas a la vez: los eventos de scroll llegan cada
+    # 100 ms y ultimo_id solo avanza cuando termina la lectura
+    carga_paginas = asyncio.Lock()
+    busqueda = {'generacion': 0}
+    # Tarjetas mostradas y su producto asociado, indexadas por Producto.id
+    tarjetas = {}
+    productos_visibles = {}
+
+    # Ticket en curso: producto_id -> nombre, precio y cantidad a vender
+    ticket = {}
+    ticket_lineas = ft.Column()
+    ticket_total_texto = ft.Text("Total Ticket: $0.00", size=16, weight="bold")
+
+    progreso_barra = ft.ProgressBar(visible=False)
 
     cuadre_texto = ft.Text(size=20)
     total_inventario_texto = ft.Text(size=20)
     totales_pago_texto = ft.Text(size=20)
 
-    def actualizar_lista_productos():
-        productos_row.controls.clear()
-        for producto in app.obtener_productos():
-            productos_row.controls.append(
-                ft.Card(
-                    content=ft.Container(
-                        content=ft.Column([
-                            ft.ListTile(
-                                leading=ft.Icon(icons.SHOPPING_BASKET),
-                                title=ft.Text(
-                                    f"{producto.nombre}",
-                                    size=16,
-                                    weight="bold"
-                                ),
-                                subtitle=ft.Text(
-                                    f"Precio: ${producto.precio:.2f}\n"
-                                    f"Cantidad: {producto.cantidad}"
-                                ),
-                            ),
-                            ft.Row([
-                                ft.IconButton(
-                                    icons.EDIT,
-                                    on_click=lambda _, p=producto: editar_producto(p)
-                                ),
-                                ft.IconButton(
-                                    icons.DELETE,
-                                    on_click=lambda _, id=producto.id: eliminar_producto(id)
-                                ),
-                                ft.IconButton(
-                                    icons.SHOPPING_CART,
-                                    on_click=lambda _, p=producto: registrar_venta_dialog(p)
-                                )
-                            ], alignment=ft.MainAxisAlignment.END)
-                        ]),
-                        width=250,
-                        padding=10,
-                    )
-                )
-            )
-        page.update()
+    def crear_tarjeta(producto):
+        productos_visibles[producto.id] = producto
+        tarjetas[producto.id] = construir_tarjeta(
+            producto,
+            lambda id: editar_producto(productos_visibles[id]),
+            eliminar_producto,
+            lambda id: registrar_venta_dialog(productos_visibles[id]),
+        )
+        return tarjetas[producto.id]
 
-    def actualizar_totales():
-        totales = app.obtener_totales_por_metodo_pago()
+    def reconciliar_tarjetas(productos):
+        anteriores = dict(tarjetas)
+        tarjetas.clear()
+        controles = []
+        cambiados = []
+        for producto in productos:
+            tarjeta = anteriores.pop(producto.id, None)
+            if tarjeta is None:
+                tarjeta = crear_tarjeta(producto)
+            else:
+                productos_visibles[producto.id] = producto
+                tarjetas[producto.id] = tarjeta
+                cambiados.extend(actualizar_tarjeta(tarjeta, producto))
+            controles.append(tarjeta)
+        for id in anteriores:
+            productos_visibles.pop(id, None)
+        if anteriores or len(controles) != len(productos_row.controls) or any(
+            a is not b for a, b in zip(controles, productos_row.controls)
+        ):
+            productos_row.controls = controles
+            incluir_en_refresco(productos_row)
+        else:
+            incluir_en_refresco(*cambiados)
+
+    async def refrescar_tarjetas(ids):
+        # Relee en una sola llamada los productos con tarjeta y devuelve los
+        # controles que cambiaron
+        ids = [id for id in ids if id in tarjetas]
+        if not ids:
+            return []
+        vigentes = {
+            producto.id: producto
+            for producto in await datos.obtener_productos_por_ids(ids)
+        }
+        cambiados = []
+        for id in ids:
+            # La tarjeta pudo desaparecer mientras se esperaba la lectura
+            if id not in tarjetas:
+                continue
+            producto = vigentes.get(id)
+            if producto is None:
+                quitar_tarjeta(id)
+                cambiados.append(productos_row)
+            else:
+                productos_visibles[id] = producto
+                cambiados.extend(actualizar_tarjeta(tarjetas[id], producto))
+        return cambiados
+
+    def quitar_tarjeta(id):
+        tarjeta = tarjetas.pop(id, None)
+        productos_visibles.pop(id, None)
+        if tarjeta is not None:
+            productos_row.controls.remove(tarjeta)
+            paginacion['cargados'] -= 1
+            incluir_en_refresco(productos_row)
+
+    async def mostrar_producto_nuevo(id):
+        # Un producto nuevo va al final del orden por id: solo es visible si
+        # ya se cargó la última página y no hay una búsqueda activa
+        if paginacion['hay_mas'] or buscar_input.value:
+            return
+        producto = await datos.obtener_producto(id)
+        if producto is not None:
+            productos_row.controls.append(crear_tarjeta(producto))
+            paginacion['ultimo_id'] = producto.id
+            paginacion['cargados'] += 1
+            incluir_en_refresco(productos_row)
+
+    async def cargar_siguiente_pagina():
+        # Si ya hay una carga en curso, este evento de scroll se descarta
+        if not paginacion['hay_mas'] or carga_paginas.locked():
+            return False
+        async with carga_paginas:
+            productos = await datos.obtener_productos_pagina(paginacion['ultimo_id'])
+            for producto in productos:
+                productos_row.controls.append(crear_tarjeta(producto))
+            if productos:
+                paginacion['ultimo_id'] = productos[-1].id
+            paginacion['cargados'] += len(productos)
+            paginacion['hay_mas'] = len(productos) == TAMANO_PAGINA
+            return bool(productos)
+
+    async def actualizar_lista_productos():
+        # Vuelve a la ventana ya cargada conservando las tarjetas existentes
+        async with carga_paginas:
+            limite = max(paginacion['cargados'], TAMANO_PAGINA)
+            productos = await datos.obtener_productos_pagina(0, limite)
+            paginacion['ultimo_id'] = productos[-1].id if productos else 0
+            paginacion['cargados'] = len(productos)
+            paginacion['hay_mas'] = len(productos) == limite
+            reconciliar_tarjetas(productos)
+
+    async def al_desplazar_productos(e):
+        # Los resultados de búsqueda no se paginan
+        if buscar_input.value:
+            return
+        if e.pixels >= e.max_scroll_extent - 300 and await cargar_siguiente_pagina():
+            incluir_en_refresco(productos_row)
+            await aplicar_refresco()
+
+    async def actualizar_totales():
+        totales = await datos.obtener_totales_por_metodo_pago()
         totales_texto = "Totales por método de pago:\n"
         for metodo, total in totales.items():
             totales_texto += f"{metodo.capitalize()}: ${total:.2f}\n"
         totales_pago_texto.value = totales_texto
-        page.update()
+        return totales_pago_texto
 
-    def agregar_producto(e):
+    async def actualizar_cuadre():
+        cuadre = await datos.obtener_cuadre_caja()
+        cuadre_texto.value = f"Cuadre de Caja: ${cuadre:.2f}"
+        return cuadre_texto
+
+    async def calcular_total_inventario():
+        total_inventario = await datos.valor_inventario()
+        total_inventario_texto.value = f"Total Inventario: ${total_inventario:.2f}"
+        return total_inventario_texto
+
+    secciones_resumen = {
+        'cuadre': actualizar_cuadre,
+        'totales': actualizar_totales,
+        'inventario': calcular_total_inventario,
+    }
+
+    @medir_manejador
+    async def aplicar_refresco():
+        # Cada manejador corre en su propia tarea: lo pendiente se toma antes
+        # del primer await y lo que otro manejador programe mientras tanto
+        # queda para su propio aplicar_refresco()
+        secciones, productos, controles = (
+            refresco['secciones'], refresco['productos'], refresco['controles']
+        )
+        refresco['secciones'] = set()
+        refresco['productos'] = set()
+        refresco['controles'] = []
+        controles.extend(await refrescar_tarjetas(productos))
+        for seccion, actualizar in secciones_resumen.items():
+            if seccion in secciones:
+                controles.append(await actualizar())
+        controles = list({id(c): c for c in controles}.values())
+        if controles:
+            page.update(*controles)
+
+    @medir_manejador
+    async def agregar_producto(e):
         try:
             nombre = nombre_input.value
             precio = float(precio_input.value)
             cantidad = int(cantidad_input.value)
+            sku = (sku_input.value or "").strip() or None
             if nombre and precio > 0 and cantidad >= 0:
-                if app.agregar_producto(nombre, precio, cantidad):
-                    actualizar_lista_productos()
+                producto_id = await datos.agregar_producto(nombre, precio, cantidad, sku)
+                if producto_id:
+                    await mostrar_producto_nuevo(producto_id)
                     nombre_input.value = ""
                     precio_input.value = ""
                     cantidad_input.value = ""
-                    actualizar_cuadre()
-                    calcular_total_inventario()
+                    sku_input.value = ""
+                    incluir_en_refresco(
+                        nombre_input, precio_input, cantidad_input, sku_input
+                    )
+                    programar_refresco('inventario')
                     mostrar_toast("Producto agregado exitosamente")
                 else:
                     mostrar_toast("Error al agregar el producto", ft.colors.RED_400)
@@ -324,7 +2023,7 @@ def main(page: ft.Page):
                 "Por favor, ingrese valores numéricos válidos para precio y cantidad",
                 ft.colors.RED_400
             )
-        page.update()
+        await aplicar_refresco()
 
     def editar_producto(producto):
         nombre_editar = ft.TextField(
@@ -339,24 +2038,30 @@ def main(page: ft.Page):
             value=str(producto.cantidad),
             label="Cantidad"
         )
+        sku_editar = ft.TextField(
+            value=producto.sku or "",
+            label="SKU / Código de barras"
+        )
 
-        def guardar_cambios(e):
+        @medir_manejador
+        async def guardar_cambios(e):
             try:
                 nombre = nombre_editar.value
                 precio = float(precio_editar.value)
                 cantidad = int(cantidad_editar.value)
+                sku = (sku_editar.value or "").strip() or None
                 if nombre and precio > 0 and cantidad >= 0:
-                    if app.actualizar_producto(
+                    if await datos.actualizar_producto(
                         producto.id,
                         nombre,
                         precio,
-                        cantidad
+                        cantidad,
+                        sku
                     ):
-                        actualizar_lista_productos()
-                        actualizar_cuadre()
-                        calcular_total_inventario()
+                        programar_refresco('inventario', productos=[producto.id])
                         mostrar_toast("Producto actualizado exitosamente")
                         dialog.open = False
+                        incluir_en_refresco(dialog)
                     else:
                         mostrar_toast(
                             "Error al actualizar el producto",
@@ -372,11 +2077,13 @@ def main(page: ft.Page):
                     "Por favor, ingrese valores numéricos válidos",
                     ft.colors.RED_400
                 )
-            page.update()
+            await aplicar_refresco()
 
         dialog = ft.AlertDialog(
             title=ft.Text("Editar Producto"),
-            content=ft.Column([nombre_editar, precio_editar, cantidad_editar]),
+            content=ft.Column(
+                [nombre_editar, precio_editar, cantidad_editar, sku_editar]
+            ),
             actions=[
                 ft.TextButton("Guardar", on_click=guardar_cambios),
                 ft.TextButton("Cancelar", on_click=lambda e: dialog.close()),
@@ -387,16 +2094,17 @@ def main(page: ft.Page):
         page.update()
 
     def eliminar_producto(id):
-        def confirmar_eliminacion(e):
-            if app.eliminar_producto(id):
-                actualizar_lista_productos()
-                actualizar_cuadre()
-                calcular_total_inventario()
+        @medir_manejador
+        async def confirmar_eliminacion(e):
+            if await datos.eliminar_producto(id):
+                quitar_tarjeta(id)
+                programar_refresco('inventario')
                 mostrar_toast("Producto eliminado exitosamente")
                 dialog.open = False
+                incluir_en_refresco(dialog)
             else:
                 mostrar_toast("Error al eliminar el producto", ft.colors.RED_400)
-            page.update()
+            await aplicar_refresco()
 
         dialog = ft.AlertDialog(
             title=ft.Text("Confirmar eliminación"),
@@ -417,60 +2125,74 @@ def main(page: ft.Page):
             prefix_icon=icons.NUMBERS
         )
 
-        def registrar_venta(e):
+        def leer_cantidad():
+            cantidad = int(cantidad_venta_input.value)
+            en_ticket = ticket.get(producto.id, {}).get('cantidad', 0)
+            if cantidad > 0 and cantidad + en_ticket <= producto.cantidad:
+                return cantidad
+            mostrar_toast(
+                "Cantidad no válida o insuficiente stock",
+                ft.colors.ORANGE_400
+            )
+            return None
+
+        @medir_manejador
+        async def registrar_venta(e):
             try:
                 if not metodo_pago_dropdown.value:
                     mostrar_toast(
                         "Por favor seleccione un método de pago",
                         ft.colors.ORANGE_400
                     )
+                    await aplicar_refresco()
                     return
 
-                cantidad = int(cantidad_venta_input.value)
-                if cantidad > 0 and cantidad <= producto.cantidad:
-                    total = producto.precio * cantidad
-                    metodo_pago = metodo_pago_dropdown.value
-                    if app.registrar_venta(
-                        producto.id,
-                        cantidad,
-                        total,
-                        metodo_pago
+                cantidad = leer_cantidad()
+                if cantidad is not None:
+                    if await datos.registrar_ticket(
+                        [(producto.id, cantidad)],
+                        metodo_pago_dropdown.value
                     ):
-                        nueva_cantidad = producto.cantidad - cantidad
-                        app.actualizar_producto(
-                            producto.id,
-                            producto.nombre,
-                            producto.precio,
-                            nueva_cantidad
+                        programar_refresco(
+                            'cuadre', 'totales', 'inventario',
+                            productos=[producto.id]
                         )
-                        actualizar_lista_productos()
-                        actualizar_cuadre()
-                        actualizar_totales()
-                        calcular_total_inventario()
                         mostrar_toast("Venta registrada exitosamente")
                         dialog.open = False
+                        incluir_en_refresco(dialog)
                     else:
                         mostrar_toast(
                             "Error al registrar la venta",
                             ft.colors.RED_400
                         )
-                else:
-                    mostrar_toast(
-                        "Cantidad no válida o insuficiente stock",
-                        ft.colors.ORANGE_400
-                    )
             except ValueError:
                 mostrar_toast(
                     "Por favor, ingrese un número válido",
                     ft.colors.RED_400
                 )
-            page.update()
+            await aplicar_refresco()
+
+        @medir_manejador
+        async def agregar_al_ticket(e):
+            try:
+                cantidad = leer_cantidad()
+                if cantidad is not None:
+                    agregar_linea_ticket(producto, cantidad)
+                    dialog.open = False
+                    incluir_en_refresco(dialog)
+            except ValueError:
+                mostrar_toast(
+                    "Por favor, ingrese un número válido",
+                    ft.colors.RED_400
+                )
+            await aplicar_refresco()
 
         dialog = ft.AlertDialog(
             title=ft.Text(f"Registrar Venta - {producto.nombre}"),
-            content=ft.Column([cantidad_venta_input, metodo_pago_dropdown]),
+            content=ft.Column([cantidad_venta_input]),
             actions=[
                 ft.TextButton("Registrar", on_click=registrar_venta),
+                ft.TextButton("Agregar al ticket", on_click=agregar_al_ticket),
                 ft.TextButton("Cancelar", on_click=lambda e: dialog.close()),
             ],
         )
@@ -478,83 +2200,470 @@ def main(page: ft.Page):
         dialog.open = True
         page.update()
 
-    def actualizar_cuadre():
-        cuadre = app.obtener_cuadre_caja()
-        cuadre_texto.value = f"Cuadre de Caja: ${cuadre:.2f}"
-        actualizar_totales()
-        page.update()
+    def agregar_linea_ticket(producto, cantidad):
+        linea = ticket.setdefault(producto.id, {
+            'nombre': producto.nombre,
+            'precio': producto.precio,
+            'cantidad': 0,
+        })
+        linea['cantidad'] += cantidad
+        mostrar_ticket()
 
-    def calcular_total_inventario():
-        total_inventario = sum(
-            producto.precio * producto.cantidad
-            for producto in app.obtener_productos()
+    def mostrar_ticket():
+        ticket_lineas.controls = [
+            ft.Text(
+                f"{linea['cantidad']} x {linea['nombre']}: "
+                f"${linea['precio'] * linea['cantidad']:.2f}"
+            )
+            for linea in ticket.values()
+        ]
+        total = sum(
+            linea['precio'] * linea['cantidad'] for linea in ticket.values()
         )
-        total_inventario_texto.value = f"Total Inventario: ${total_inventario:.2f}"
+        ticket_total_texto.value = f"Total Ticket: ${total:.2f}"
+        incluir_en_refresco(ticket_lineas, ticket_total_texto)
+
+    @medir_manejador
+    async def cobrar_ticket(e):
+        if not ticket:
+            mostrar_toast("El ticket está vacío", ft.colors.ORANGE_400)
+        elif not metodo_pago_dropdown.value:
+            mostrar_toast(
+                "Por favor seleccione un método de pago",
+                ft.colors.ORANGE_400
+            )
+        elif await datos.registrar_ticket(
+            [(id, linea['cantidad']) for id, linea in ticket.items()],
+            metodo_pago_dropdown.value
+        ):
+            programar_refresco(
+                'cuadre', 'totales', 'inventario',
+                productos=list(ticket)
+            )
+            ticket.clear()
+            mostrar_ticket()
+            mostrar_toast("Venta registrada exitosamente")
+        else:
+            mostrar_toast(
+                "Error al registrar la venta o stock insuficiente",
+                ft.colors.RED_400
+            )
+        await aplicar_refresco()
+
+    @medir_manejador
+    async def escanear_codigo(e):
+        # Cada lectura suma una unidad al ticket sin abrir diálogos y deja
+        # el foco en el campo para el siguiente código
+        codigo = (escaner_input.value or "").strip()
+        escaner_input.value = ""
+        incluir_en_refresco(escaner_input)
+        if codigo:
+            producto = await datos.buscar_por_sku(codigo)
+            if producto is None:
+                mostrar_toast(f"Código no encontrado: {codigo}", ft.colors.RED_400)
+            elif producto.cantidad < ticket.get(producto.id, {}).get('cantidad', 0) + 1:
+                mostrar_toast(
+                    f"Stock insuficiente de {producto.nombre}",
+                    ft.colors.ORANGE_400
+                )
+            else:
+                agregar_linea_ticket(producto, 1)
+        await aplicar_refresco()
+        escaner_input.focus()
+
+    async def al_presionar_tecla(e):
+        # F12 cobra el ticket sin tener que soltar el lector
+        if e.key == "F12":
+            await cobrar_ticket(e)
+        elif e.ctrl and e.shift and e.key == "D":
+            mostrar_diagnostico()
+
+    def mostrar_diagnostico():
+        # Vista oculta con los histogramas de consultas, manejadores y
+        # actualizaciones de página (Ctrl+Shift+D)
+        contenido = ft.Column(scroll=ft.ScrollMode.AUTO, width=720, height=480)
+
+        def lineas(histogramas, unidad):
+            ordenados = sorted(
+                histogramas.items(), key=lambda par: par[1]['suma'], reverse=True
+            )
+            return [
+                ft.Text(
+                    f"{clave}\n    n={h['cantidad']}  p50={h['p50']:.2f}{unidad}  "
+                    f"p99={h['p99']:.2f}{unidad}  máx={h['maximo']:.2f}{unidad}  "
+                    f"{barras(h['cubos'])}",
+                    size=12,
+                    selectable=True,
+                )
+                for clave, h in ordenados[:LIMITE_DIAGNOSTICO]
+            ]
+
+        def mostrar_resumen():
+            resumen = diagnostico.resumen()
+            actualizaciones = resumen['actualizaciones_controles']
+            contenido.controls = [
+                ft.Text(
+                    f"Registro {'activo' if diagnostico.activo else 'inactivo'} "
+                    f"desde {resumen['desde']}",
+                    weight="bold",
+                ),
+                ft.Text("Consultas (ms)", size=16, weight="bold"),
+                *lineas(resumen['consultas_ms'], 'ms'),
+                ft.Text("Manejadores (ms)", size=16, weight="bold"),
+                *lineas(resumen['manejadores_ms'], 'ms'),
+                ft.Text("Actualizaciones de página (controles)", size=16, weight="bold"),
+                *lineas({'page.update': actualizaciones}, ''),
+            ]
+            alternar_boton.text = "Desactivar" if diagnostico.activo else "Activar"
+            page.update(contenido, alternar_boton)
+
+        def alternar(e):
+            diagnostico.activo = not diagnostico.activo
+            mostrar_resumen()
+
+        def reiniciar(e):
+            diagnostico.reiniciar()
+            mostrar_resumen()
+
+        async def guardar(e):
+            filename = f"diagnostico_{datetime.now():%Y%m%d_%H%M%S}.json"
+            if diagnostico.volcar(filename):
+                mostrar_toast(f"Diagnóstico guardado: {filename}")
+            else:
+                mostrar_toast("Error al guardar el diagnóstico", ft.colors.RED_400)
+            await aplicar_refresco()
+
+        alternar_boton = ft.TextButton("Activar", on_click=alternar)
+        dialog = ft.AlertDialog(
+            title=ft.Text("Diagnóstico"),
+            content=contenido,
+            actions=[
+                alternar_boton,
+                ft.TextButton("Actualizar", on_click=lambda e: mostrar_resumen()),
+                ft.TextButton("Reiniciar", on_click=reiniciar),
+                ft.TextButton("Guardar JSON", on_click=guardar),
+                ft.TextButton("Cerrar", on_click=lambda e: dialog.close()),
+            ],
+        )
+        page.dialog = dialog
+        dialog.open = True
         page.update()
-    def buscar_producto(e):
-        query = buscar_input.value.lower()
-        productos_row.controls.clear()
-        for producto in app.obtener_productos():
-            if query in producto.nombre.lower():
-                productos_row.controls.append(
-                    ft.Card(
-                        content=ft.Container(
-                            content=ft.Column([
-                                ft.ListTile(
-                                    leading=ft.Icon(icons.SHOPPING_BASKET),
-                                    title=ft.Text(
-                                        f"{producto.nombre}",
-                                        size=16,
-                                        weight="bold"
-                                    ),
-                                    subtitle=ft.Text(
-                                        f"Precio: ${producto.precio:.2f}\n"
-                                        f"Cantidad: {producto.cantidad}"
-                                    ),
-                                ),
-                                ft.Row([
-                                    ft.IconButton(
-                                        icons.EDIT,
-                                        on_click=lambda _, p=producto: editar_producto(p)
-                                    ),
-                                    ft.IconButton(
-                                        icons.DELETE,
-                                        on_click=lambda _, id=producto.id: eliminar_producto(id)
-                                    ),
-                                    ft.IconButton(
-                                        icons.SHOPPING_CART,
-                                        on_click=lambda _, p=producto: registrar_venta_dialog(p)
-                                    )
-                                ], alignment=ft.MainAxisAlignment.END)
-                            ]),
-                            width=250,
-                            padding=10,
-                        )
-                    )
+        mostrar_resumen()
+
+    async def vaciar_ticket(e):
+        ticket.clear()
+        mostrar_ticket()
+        await aplicar_refresco()
+
+    async def buscar_producto(e):
+        # Cada tecla invalida la búsqueda anterior: solo se consulta cuando
+        # el usuario deja de escribir y se descartan resultados obsoletos
+        busqueda['generacion'] += 1
+        generacion = busqueda['generacion']
+        await asyncio.sleep(RETARDO_BUSQUEDA)
+        if generacion == busqueda['generacion']:
+            await ejecutar_busqueda(generacion)
+
+    @medir_manejador
+    async def ejecutar_busqueda(generacion):
+        # Separada de buscar_producto para no medir la espera del debounce
+        query = buscar_input.value.strip()
+        if not query:
+            await actualizar_lista_productos()
+        else:
+            productos = await datos.buscar_productos(query)
+            if generacion != busqueda['generacion']:
+                return
+            reconciliar_tarjetas(productos)
+        await aplicar_refresco()
+
+    @medir_manejador
+    async def importar_productos(e):
+        if not e.files:
+            return
+        progreso_barra.value = None
+        progreso_barra.visible = True
+        progreso_barra.update()
+        resultado = await datos.con_progreso(
+            'importar_productos_csv', mostrar_progreso, e.files[0].path
+        )
+        progreso_barra.visible = False
+        incluir_en_refresco(progreso_barra)
+        if resultado is None:
+            mostrar_toast("Error al importar el archivo", ft.colors.RED_400)
+        else:
+            await actualizar_lista_productos()
+            programar_refresco('inventario')
+            rechazados = resultado['rechazados']
+            mostrar_toast(
+                f"Importación: {resultado['insertados']} nuevos, "
+                f"{resultado['actualizados']} actualizados, "
+                f"{len(rechazados)} rechazados",
+                ft.colors.ORANGE_400 if rechazados else ft.colors.GREEN
+            )
+            if rechazados:
+                dialog = ft.AlertDialog(
+                    title=ft.Text("Filas rechazadas"),
+                    content=ft.Column(
+                        [
+                            ft.Text(f"Línea {linea}: {motivo}")
+                            for linea, motivo in rechazados[:50]
+                        ] + (
+                            [ft.Text(f"... y {len(rechazados) - 50} más")]
+                            if len(rechazados) > 50 else []
+                        ),
+                        scroll="auto",
+                    ),
+                    actions=[
+                        ft.TextButton("Cerrar", on_click=lambda e: dialog.close()),
+                    ],
                 )
+                page.dialog = dialog
+                dialog.open = True
+        await aplicar_refresco()
         page.update()
 
+    selector_importacion = ft.FilePicker(on_result=importar_productos)
+    page.overlay.append(selector_importacion)
+
+    def mostrar_progreso(hechos, total):
+        progreso_barra.value = hechos / total if total else None
+        progreso_barra.update()
+
     def exportar_reporte(e):
-        if app.generar_reporte_csv():
-            mostrar_toast("Reporte generado exitosamente")
+        tipo_dropdown = ft.Dropdown(
+            label="Reporte",
+            value="productos",
+            options=[
+                ft.dropdown.Option("productos", "Inventario"),
+                ft.dropdown.Option("ventas", "Ventas"),
+                ft.dropdown.Option("resumen_diario", "Resumen diario"),
+            ],
+        )
+        desde_input = ft.TextField(label="Desde (AAAA-MM-DD)")
+        hasta_input = ft.TextField(label="Hasta (AAAA-MM-DD)")
+        comprimir_check = ft.Checkbox(label="Comprimir (gzip)")
+
+        @medir_manejador
+        async def iniciar_exportacion(e):
+            try:
+                desde = hasta = None
+                if desde_input.value:
+                    desde = date.fromisoformat(desde_input.value).isoformat()
+                if hasta_input.value:
+                    # La fecha final es inclusiva en la interfaz
+                    hasta = (
+                        date.fromisoformat(hasta_input.value) + timedelta(days=1)
+                    ).isoformat()
+            except ValueError:
+                mostrar_toast(
+                    "Por favor, ingrese fechas con formato AAAA-MM-DD",
+                    ft.colors.RED_400
+                )
+                await aplicar_refresco()
+                return
+            tipo = tipo_dropdown.value
+            filename = f"reporte_{tipo}_{datetime.now():%Y%m%d_%H%M%S}.csv"
+            if comprimir_check.value:
+                filename += ".gz"
+            dialog.open = False
+            progreso_barra.value = None
+            progreso_barra.visible = True
+            page.update(dialog, progreso_barra)
+            if await datos.con_progreso(
+                'exportar_csv', mostrar_progreso, tipo, filename,
+                desde=desde, hasta=hasta, comprimir=comprimir_check.value
+            ):
+                mostrar_toast(f"Reporte generado: {filename}")
+            else:
+                mostrar_toast("Error al generar el reporte", ft.colors.RED_400)
+            progreso_barra.visible = False
+            incluir_en_refresco(progreso_barra)
+            await aplicar_refresco()
+
+        dialog = ft.AlertDialog(
+            title=ft.Text("Exportar Reporte"),
+            content=ft.Column(
+                [tipo_dropdown, desde_input, hasta_input, comprimir_check],
+                tight=True,
+            ),
+            actions=[
+                ft.TextButton("Exportar", on_click=iniciar_exportacion),
+                ft.TextButton("Cancelar", on_click=lambda e: dialog.close()),
+            ],
+        )
+        page.dialog = dialog
+        dialog.open = True
+        page.update()
+
+    @medir_manejador
+    async def respaldar_ahora(e):
+        progreso_barra.value = None
+        progreso_barra.visible = True
+        progreso_barra.update()
+        ruta = await respaldos.con_progreso('respaldar', mostrar_progreso)
+        if ruta:
+            mostrar_toast(f"Respaldo guardado: {ruta}")
         else:
-            mostrar_toast("Error al generar el reporte", ft.colors.RED_400)
+            mostrar_toast("Error al respaldar la base de datos", ft.colors.RED_400)
+        progreso_barra.visible = False
+        incluir_en_refresco(progreso_barra)
+        await aplicar_refresco()
+
+    def mostrar_reportes(e):
+        hoy = date.today()
+        tipo_dropdown = ft.Dropdown(
+            label="Reporte",
+            value="dia",
+            options=[
+                ft.dropdown.Option("producto", "Ventas por producto"),
+                ft.dropdown.Option("hora", "Ventas por hora del día"),
+                ft.dropdown.Option("dia", "Ventas por día"),
+                ft.dropdown.Option("semana", "Ventas por semana"),
+                ft.dropdown.Option("mes", "Ventas por mes"),
+                ft.dropdown.Option("mas_vendidos", "Más vendidos"),
+                ft.dropdown.Option("menos_vendidos", "Menos vendidos"),
+                ft.dropdown.Option("existencias", "Inventario al cierre de Hasta"),
+            ],
+        )
+        desde_input = ft.TextField(
+            label="Desde (AAAA-MM-DD)", value=hoy.replace(day=1).isoformat()
+        )
+        hasta_input = ft.TextField(label="Hasta (AAAA-MM-DD)", value=hoy.isoformat())
+        tabla = ft.Column(scroll=ft.ScrollMode.AUTO, width=640, height=360)
+
+        def tabla_datos(columnas, filas):
+            return ft.DataTable(
+                columns=[ft.DataColumn(ft.Text(columna)) for columna in columnas],
+                rows=[
+                    ft.DataRow(cells=[ft.DataCell(ft.Text(valor)) for valor in fila])
+                    for fila in filas[:LIMITE_FILAS_REPORTE]
+                ],
+            )
+
+        @medir_manejador
+        async def generar_reporte(e):
+            try:
+                desde = date.fromisoformat(desde_input.value).isoformat()
+                # La fecha final es inclusiva en la interfaz
+                hasta = (
+                    date.fromisoformat(hasta_input.value) + timedelta(days=1)
+                ).isoformat()
+            except ValueError:
+                mostrar_toast(
+                    "Por favor, ingrese fechas con formato AAAA-MM-DD",
+                    ft.colors.RED_400
+                )
+                await aplicar_refresco()
+                return
+            tipo = tipo_dropdown.value
+            if tipo == "existencias":
+                existencias = await datos.existencias_en(hasta)
+                nombres = {
+                    producto.id: producto.nombre
+                    for producto in await datos.obtener_productos()
+                }
+                filas = [
+                    (nombres.get(id, f"#{id}"), cantidad, precio)
+                    for id, (cantidad, precio) in sorted(existencias.items())
+                    if cantidad
+                ]
+                contenido = tabla_datos(
+                    ["Producto", "Stock", "Precio", "Valor"],
+                    [
+                        (nombre, str(cantidad), f"${precio:.2f}",
+                         f"${cantidad * precio:.2f}")
+                        for nombre, cantidad, precio in filas
+                    ],
+                )
+            elif tipo in ("mas_vendidos", "menos_vendidos"):
+                filas = await getattr(reportes, tipo)(desde, hasta)
+                contenido = tabla_datos(
+                    ["Producto", "Unidades", "Total", "Stock"],
+                    [
+                        (producto.nombre, str(unidades), f"${total:.2f}",
+                         str(producto.cantidad))
+                        for producto, unidades, total in filas
+                    ],
+                )
+            else:
+                filas = await reportes.ventas_por(tipo, desde, hasta)
+                if tipo == "producto":
+                    nombres = {
+                        producto.id: producto.nombre
+                        for producto in await datos.obtener_productos()
+                    }
+                    filas = [
+                        (nombres.get(id, f"#{id}"), *resto) for id, *resto in filas
+                    ]
+                elif tipo == "hora":
+                    filas = [(f"{hora:02d}:00", *resto) for hora, *resto in filas]
+                contenido = tabla_datos(
+                    ["Período" if tipo != "producto" else "Producto",
+                     "Ventas", "Unidades", "Total"],
+                    [
+                        (str(clave), str(ventas), str(unidades), f"${total:.2f}")
+                        for clave, ventas, unidades, total in filas
+                    ],
+                )
+            tabla.controls = [contenido] if filas else [
+                ft.Text("Sin ventas en el rango seleccionado")
+            ]
+            incluir_en_refresco(tabla)
+            await aplicar_refresco()
+
+        dialog = ft.AlertDialog(
+            title=ft.Text("Reportes de Ventas"),
+            content=ft.Column(
+                [
+                    tipo_dropdown,
+                    ft.Row([desde_input, hasta_input]),
+                    tabla,
+                ],
+                tight=True,
+            ),
+            actions=[
+                ft.TextButton("Generar", on_click=generar_reporte),
+                ft.TextButton("Cerrar", on_click=lambda e: dialog.close()),
+            ],
+        )
+        page.dialog = dialog
+        dialog.open = True
+        page.update()
 
     # Creación de la interfaz principal
     page.add(
         ft.AppBar(
             title=ft.Text("Inventario y Cuadre de Caja"),
             actions=[
+                ft.IconButton(
+                    icon=icons.FILE_UPLOAD,
+                    on_click=lambda e: selector_importacion.pick_files(
+                        allowed_extensions=["csv"]
+                    ),
+                    tooltip="Importar Productos (CSV)"
+                ),
                 ft.IconButton(
                     icon=icons.FILE_DOWNLOAD,
                     on_click=exportar_reporte,
                     tooltip="Exportar Reporte"
                 ),
+                ft.IconButton(
+                    icon=icons.INSIGHTS,
+                    on_click=mostrar_reportes,
+                    tooltip="Reportes de Ventas"
+                ),
+                ft.IconButton(
+                    icon=icons.BACKUP,
+                    on_click=respaldar_ahora,
+                    tooltip="Respaldar base de datos"
+                ),
                 tema_button
             ],
         ),
         ft.Container(
             content=ft.Column([
+                progreso_barra,
                 ft.Row([
                     buscar_input,
                 ], alignment=ft.MainAxisAlignment.CENTER),
@@ -568,6 +2677,7 @@ def main(page: ft.Page):
                     nombre_input,
                     precio_input,
                     cantidad_input,
+                    sku_input,
                     ft.IconButton(
                         icon=icons.ADD_CIRCLE,
                         on_click=agregar_producto,
@@ -583,6 +2693,30 @@ def main(page: ft.Page):
                 ),
                 productos_row,
                 ft.Divider(),
+                ft.Container(
+                    content=ft.Column([
+                        ft.Text(
+                            "Ticket Actual",
+                            size=20,
+                            weight="bold"
+                        ),
+                        escaner_input,
+                        ticket_lineas,
+                        ticket_total_texto,
+                        ft.Row([
+                            metodo_pago_dropdown,
+                            ft.ElevatedButton(
+                                "Cobrar",
+                                icon=icons.POINT_OF_SALE,
+                                on_click=cobrar_ticket
+                            ),
+                            ft.TextButton("Vaciar", on_click=vaciar_ticket),
+                        ]),
+                    ]),
+                    padding=20,
+                    border=ft.border.all(1, ft.colors.OUTLINE),
+                    border_radius=10,
+                ),
                 ft.Container(
                     content=ft.Column([
                         ft.Text(
@@ -600,18 +2734,38 @@ def main(page: ft.Page):
                 )
             ]),
             padding=20,
+            expand=True,
         )
     )
 
     # Configurar el evento de búsqueda
     buscar_input.on_change = buscar_producto
+    escaner_input.on_submit = escanear_codigo
+    page.on_keyboard_event = al_presionar_tecla
+    productos_row.on_scroll = al_desplazar_productos
 
     # Inicializar la interfaz
-    actualizar_lista_productos()
-    actualizar_cuadre()
-    calcular_total_inventario()
-    actualizar_totales()
+    await actualizar_lista_productos()
+    programar_refresco('cuadre', 'totales', 'inventario')
+    await aplicar_refresco()
 
 
 if __name__ == "__main__":
-    ft.app(target=main)
\ No newline at end of file
+    if '--reconstruir-resumenes' in sys.argv:
+        if not InventarioCajaApp().reconstruir_resumenes():
+            sys.exit(1)
+    elif '--archivar-ventas' in sys.argv:
+        if InventarioCajaApp().archivar_ventas() is None:
+            sys.exit(1)
+    elif '--respaldar' in sys.argv:
+        if Respaldos(InventarioCajaApp()).respaldar() is None:
+            sys.exit(1)
+    elif '--restaurar' in sys.argv:
+        # python app.py --restaurar RESPALDO DESTINO
+        argumentos = sys.argv[sys.argv.index('--restaurar') + 1:]
+        if len(argumentos) != 2 or not restaurar(*argumentos):
+            sys.exit(1)
+    elif ft is None:
+        sys.exit("Falta el paquete flet para abrir la interfaz")
+    else:
+        ft.app(target=main)
\ No newline at end of file
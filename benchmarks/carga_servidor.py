@@ -0,0 +1,224 @@
+"""Prueba de carga del servidor JSON: peticiones por segundo y latencia.
+
+Uso (desde la raíz del repositorio):
+
+    python -m benchmarks.carga_servidor --conexiones 16 --segundos 10
+    python -m benchmarks.carga_servidor --puerto 8765 --salida carga.json
+
+Sin --puerto levanta un servidor en un subproceso sobre una base temporal
+generada con benchmarks.generar_datos; con --puerto mide una instancia que
+ya está corriendo en 127.0.0.1. Los clientes comparten un proceso, así que
+con muchas conexiones el resultado es una cota inferior del servidor.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.generar_datos import generar
+from servidor import HOST, METODOS_PAGO
+
+# (nombre, peso) de cada tipo de petición en la mezcla
+MEZCLA = (
+    ('producto', 40),
+    ('buscar', 20),
+    ('pagina', 10),
+    ('ids', 10),
+    ('lote', 5),
+    ('resumen', 5),
+    ('ticket', 10),
+)
+PALABRAS_BUSQUEDA = ('Producto 1', 'Producto 2', 'Producto 33', 'Producto 404')
+
+
+class Cliente:
+    # Conexión HTTP/1.1 persistente, una petición a la vez
+    def __init__(self, puerto):
+        self.puerto = puerto
+
+    async def abrir(self):
+        self.reader, self.writer = await asyncio.open_connection(HOST, self.puerto)
+
+    async def pedir(self, metodo, ruta, datos=None):
+        cuerpo = b'' if datos is None else json.dumps(datos).encode('utf-8')
+        self.writer.write(
+            f"{metodo} {ruta} HTTP/1.1\r\nHost: {HOST}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(cuerpo)}\r\n"
+            "\r\n".encode('latin-1') + cuerpo
+        )
+        await self.writer.drain()
+        estado = int((await self.reader.readline()).split()[1])
+        largo = 0
+        while True:
+            linea = await self.reader.readline()
+            if linea in (b'\r\n', b''):
+                break
+            nombre, _, valor = linea.decode('latin-1').partition(':')
+            if nombre.lower() == 'content-length':
+                largo = int(valor)
+        return estado, await self.reader.readexactly(largo)
+
+    def cerrar(self):
+        self.writer.close()
+
+
+def peticion(tipo, ids, aleatorio):
+    if tipo == 'producto':
+        return 'GET', f'/productos/{aleatorio.choice(ids)}', None
+    if tipo == 'buscar':
+        return 'GET', f"/buscar?q={aleatorio.choice(PALABRAS_BUSQUEDA).replace(' ', '+')}", None
+    if tipo == 'pagina':
+        return 'GET', f'/productos?despues_de={aleatorio.choice(ids)}&limite=60', None
+    if tipo == 'ids':
+        return 'GET', f"/productos?ids={','.join(map(str, aleatorio.sample(ids, 20)))}", None
+    if tipo == 'lote':
+        return 'POST', '/lote', {'peticiones': [
+            f'/productos/{id}' for id in aleatorio.sample(ids, 10)
+        ] + ['/resumen']}
+    if tipo == 'resumen':
+        return 'GET', '/resumen', None
+    return 'POST', '/tickets', {
+        'lineas': [
+            {'producto_id': aleatorio.choice(ids), 'cantidad': 1}
+            for _ in range(aleatorio.randint(1, 3))
+        ],
+        'metodo_pago': aleatorio.choice(METODOS_PAGO),
+    }
+
+
+async def trabajador(puerto, ids, fin, semilla, latencias, estados):
+    aleatorio = random.Random(semilla)
+    tipos, pesos = zip(*MEZCLA)
+    cliente = Cliente(puerto)
+    await cliente.abrir()
+    try:
+        while time.perf_counter() < fin:
+            tipo = aleatorio.choices(tipos, pesos)[0]
+            metodo, ruta, datos = peticion(tipo, ids, aleatorio)
+            inicio = time.perf_counter()
+            estado, _ = await cliente.pedir(metodo, ruta, datos)
+            latencias[tipo].append(time.perf_counter() - inicio)
+            estados[estado] = estados.get(estado, 0) + 1
+    finally:
+        cliente.cerrar()
+
+
+async def cargar(puerto, conexiones, segundos):
+    cliente = Cliente(puerto)
+    await cliente.abrir()
+    ids = []
+    despues_de = 0
+    while despues_de is not None:
+        _, cuerpo = await cliente.pedir('GET', f'/productos?despues_de={despues_de}&limite=500')
+        pagina = json.loads(cuerpo)
+        ids.extend(producto['id'] for producto in pagina['productos'])
+        despues_de = pagina['siguiente']
+    cliente.cerrar()
+
+    latencias = {tipo: [] for tipo, _ in MEZCLA}
+    estados = {}
+    inicio = time.perf_counter()
+    fin = inicio + segundos
+    await asyncio.gather(*(
+        trabajador(puerto, ids, fin, semilla, latencias, estados)
+        for semilla in range(conexiones)
+    ))
+    return time.perf_counter() - inicio, latencias, estados
+
+
+def resumir(valores, duracion):
+    valores.sort()
+    if not valores:
+        return {'peticiones': 0}
+    return {
+        'peticiones': len(valores),
+        'por_segundo': len(valores) / duracion,
+        'p50_ms': statistics.median(valores) * 1000,
+        'p99_ms': valores[min(len(valores) - 1, int(len(valores) * 0.99))] * 1000,
+        'maximo_ms': valores[-1] * 1000,
+    }
+
+
+def puerto_libre():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def esperar_servidor(puerto, proceso, espera=30):
+    limite = time.monotonic() + espera
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            sys.exit(f'El servidor terminó con código {proceso.returncode}')
+        try:
+            socket.create_connection((HOST, puerto), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    sys.exit('El servidor no respondió a tiempo')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--puerto', type=int, help='servidor ya iniciado en 127.0.0.1')
+    parser.add_argument('--conexiones', type=int, default=16)
+    parser.add_argument('--segundos', type=float, default=10)
+    parser.add_argument('--productos', type=int, default=10_000)
+    parser.add_argument('--ventas', type=int, default=100_000)
+    parser.add_argument('--hilos', type=int, default=4)
+    parser.add_argument('--salida', help='archivo JSON de resultados (por defecto stdout)')
+    args = parser.parse_args()
+
+    directorio = None
+    proceso = None
+    puerto = args.puerto
+    if puerto is None:
+        directorio = tempfile.TemporaryDirectory()
+        ruta = os.path.join(directorio.name, 'carga.db')
+        print(f'Generando {args.productos} productos y {args.ventas} ventas...',
+              file=sys.stderr)
+        generar(ruta, args.productos, args.ventas)
+        puerto = puerto_libre()
+        proceso = subprocess.Popen(
+            [sys.executable, '-m', 'servidor', '--ruta', ruta,
+             '--puerto', str(puerto), '--hilos', str(args.hilos)],
+            stdout=sys.stderr,
+        )
+        esperar_servidor(puerto, proceso)
+    try:
+        duracion, latencias, estados = asyncio.run(
+            cargar(puerto, args.conexiones, args.segundos)
+        )
+    finally:
+        if proceso is not None:
+            proceso.terminate()
+            proceso.wait()
+        if directorio is not None:
+            directorio.cleanup()
+
+    todas = [valor for valores in latencias.values() for valor in valores]
+    informe = {
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'conexiones': args.conexiones,
+        'segundos': duracion,
+        'total': resumir(todas, duracion),
+        'por_tipo': {tipo: resumir(valores, duracion) for tipo, valores in latencias.items()},
+        'estados': {str(estado): cantidad for estado, cantidad in sorted(estados.items())},
+    }
+    texto = json.dumps(informe, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as file:
+            file.write(texto + '\n')
+    else:
+        print(texto)
+
+
+if __name__ == '__main__':
+    main()
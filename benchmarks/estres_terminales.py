@@ -0,0 +1,125 @@
+"""Simula varias terminales POS vendiendo a la vez sobre el mismo archivo.
+
+Uso (desde la raíz del repositorio):
+
+    python -m benchmarks.estres_terminales --terminales 4 --segundos 10
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from app import InventarioCajaApp
+
+METODOS_PAGO = ('efectivo', 'debito', 'credito')
+STOCK_INICIAL = 1_000_000
+
+
+def preparar_base(ruta, productos):
+    app = InventarioCajaApp(ruta)
+    for i in range(productos):
+        app.agregar_producto(f'Producto {i}', round(random.uniform(1, 100), 2), STOCK_INICIAL)
+    app.cerrar()
+
+
+def terminal(ruta, segundos, semilla, resultados):
+    app = InventarioCajaApp(ruta)
+    ids = [producto.id for producto in app.obtener_productos()]
+    aleatorio = random.Random(semilla)
+    latencias = []
+    fallidas = 0
+    fin = time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        lineas = [
+            (aleatorio.choice(ids), aleatorio.randint(1, 3))
+            for _ in range(aleatorio.randint(1, 5))
+        ]
+        inicio = time.perf_counter()
+        if not app.registrar_ticket(lineas, aleatorio.choice(METODOS_PAGO)):
+            fallidas += 1
+        latencias.append(time.perf_counter() - inicio)
+        # Las terminales también refrescan el resumen mientras otras venden
+        if aleatorio.random() < 0.3:
+            app.obtener_cuadre_caja()
+            app.obtener_totales_por_metodo_pago()
+    app.cerrar()
+    resultados.put((semilla, latencias, fallidas))
+
+
+def verificar(ruta):
+    app = InventarioCajaApp(ruta)
+    with app._lector() as cursor:
+        cursor.execute('''
+            SELECT COUNT(*) FROM productos p
+            WHERE p.cantidad + COALESCE(
+                (SELECT SUM(v.cantidad) FROM ventas v WHERE v.producto_id = p.id), 0
+            ) != ?
+        ''', (STOCK_INICIAL,))
+        descuadres_stock = cursor.fetchone()[0]
+        cursor.execute('SELECT COALESCE(SUM(total), 0) FROM ventas')
+        total_ventas = cursor.fetchone()[0]
+        cursor.execute('SELECT COALESCE(SUM(total), 0) FROM resumen_diario')
+        total_resumen = cursor.fetchone()[0]
+    descuadres_kardex = len(app.verificar_existencias())
+    app.cerrar()
+    return descuadres_stock, abs(total_ventas - total_resumen) < 0.01, descuadres_kardex
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--terminales', type=int, default=4)
+    parser.add_argument('--segundos', type=float, default=10)
+    parser.add_argument('--productos', type=int, default=200)
+    parser.add_argument('--ruta', help='archivo de base de datos (por defecto uno temporal)')
+    args = parser.parse_args()
+
+    directorio = None
+    ruta = args.ruta
+    if ruta is None:
+        directorio = tempfile.TemporaryDirectory()
+        ruta = os.path.join(directorio.name, 'estres.db')
+    preparar_base(ruta, args.productos)
+
+    resultados = multiprocessing.Queue()
+    procesos = [
+        multiprocessing.Process(
+            target=terminal,
+            args=(ruta, args.segundos, semilla, resultados)
+        )
+        for semilla in range(args.terminales)
+    ]
+    for proceso in procesos:
+        proceso.start()
+    por_terminal = [resultados.get() for _ in procesos]
+    for proceso in procesos:
+        proceso.join()
+
+    latencias = sorted(l for _, lats, _ in por_terminal for l in lats)
+    fallidas = sum(f for _, _, f in por_terminal)
+    descuadres_stock, resumen_ok, descuadres_kardex = verificar(ruta)
+
+    print(f"Terminales: {args.terminales}  duración: {args.segundos}s")
+    for semilla, lats, f in sorted(por_terminal):
+        print(f"  terminal {semilla}: {len(lats)} tickets, {f} fallidos")
+    print(f"Tickets/s: {len(latencias) / args.segundos:.1f}")
+    if latencias:
+        p99 = latencias[min(len(latencias) - 1, int(len(latencias) * 0.99))]
+        print(f"Latencia p50: {statistics.median(latencias) * 1000:.2f} ms  "
+              f"p99: {p99 * 1000:.2f} ms")
+    print(f"Tickets fallidos: {fallidas}")
+    print(f"Productos con stock descuadrado: {descuadres_stock}")
+    print(f"Resumen diario consistente: {'sí' if resumen_ok else 'no'}")
+    print(f"Productos con kardex descuadrado: {descuadres_kardex}")
+
+    if directorio is not None:
+        directorio.cleanup()
+    if fallidas or descuadres_stock or not resumen_ok or descuadres_kardex:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
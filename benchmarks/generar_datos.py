@@ -0,0 +1,91 @@
+"""Genera una base inventario_caja.db sintética para medir la app a escala.
+
+Uso (desde la raíz del repositorio):
+
+    python -m benchmarks.generar_datos --productos 100000 --ventas 10000000 --ruta grande.db
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from app import FORMATO_FECHA, InventarioCajaApp
+
+METODOS_PAGO = ('efectivo', 'debito', 'credito')
+TAMANO_LOTE = 50_000
+
+
+def generar(ruta, productos, ventas, anios=3, semilla=0):
+    # Los triggers de resúmenes y valorización corren como en producción,
+    # así la base generada es coherente con la que mantiene la app
+    aleatorio = random.Random(semilla)
+    app = InventarioCajaApp(ruta)
+    hasta = datetime.now().replace(microsecond=0)
+    desde = hasta - timedelta(days=365 * anios)
+    precios = []
+    for inicio in range(0, productos, TAMANO_LOTE):
+        lote = []
+        for i in range(inicio, min(inicio + TAMANO_LOTE, productos)):
+            precio = round(aleatorio.lognormvariate(7, 1.5), 2)
+            precios.append(precio)
+            lote.append((
+                f'Producto {i}', precio, aleatorio.randint(0, 500), f'SKU{i:08d}'
+            ))
+        with app._transaccion() as cursor:
+            cursor.execute('SELECT COALESCE(MAX(id), 0) FROM productos')
+            ultimo_id = cursor.fetchone()[0]
+            cursor.executemany(
+                'INSERT INTO productos (nombre, precio, cantidad, sku) VALUES (?, ?, ?, ?)',
+                lote
+            )
+            # Alta en el kardex con la fecha de inicio del historial; las
+            # ventas sintéticas no descuentan stock
+            cursor.execute('''
+                INSERT INTO movimientos (producto_id, fecha, tipo, cantidad, precio)
+                SELECT id, ?, 'alta', cantidad, precio FROM productos WHERE id > ?
+            ''', (desde.strftime(FORMATO_FECHA), ultimo_id))
+
+    # Ventas en orden cronológico repartidas de forma pareja en `anios`
+    paso = (hasta - desde).total_seconds() / max(ventas, 1)
+    for inicio in range(0, ventas, TAMANO_LOTE):
+        lote = []
+        for i in range(inicio, min(inicio + TAMANO_LOTE, ventas)):
+            producto = aleatorio.randrange(productos)
+            cantidad = aleatorio.randint(1, 5)
+            fecha = desde + timedelta(seconds=i * paso)
+            lote.append((
+                producto + 1,
+                cantidad,
+                round(precios[producto] * cantidad, 2),
+                aleatorio.choice(METODOS_PAGO),
+                fecha.strftime(FORMATO_FECHA),
+            ))
+        with app._transaccion() as cursor:
+            cursor.executemany('''
+                INSERT INTO ventas (producto_id, cantidad, total, metodo_pago, fecha)
+                VALUES (?, ?, ?, ?, ?)
+            ''', lote)
+    app.conn.execute('ANALYZE')
+    app.cerrar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--productos', type=int, default=1_000)
+    parser.add_argument('--ventas', type=int, default=100_000)
+    parser.add_argument('--anios', type=int, default=3)
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--ruta', default='inventario_caja.db')
+    args = parser.parse_args()
+    if os.path.exists(args.ruta):
+        parser.error(f'{args.ruta} ya existe')
+
+    inicio = time.perf_counter()
+    generar(args.ruta, args.productos, args.ventas, args.anios, args.semilla)
+    print(f"{args.ruta}: {args.productos} productos, {args.ventas} ventas "
+          f"en {time.perf_counter() - inicio:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Compara la memoria por producto de la clase con __dict__ y la de __slots__.
+
+Uso (desde la raíz del repositorio):
+
+    python -m benchmarks.memoria_producto --productos 100000
+"""
+import argparse
+import tracemalloc
+
+from app import Producto
+
+
+class ProductoConDict:
+    # Representación anterior de Producto, con __dict__ por instancia
+    def __init__(self, id, nombre, precio, cantidad):
+        self.id = id
+        self.nombre = nombre
+        self.precio = precio
+        self.cantidad = cantidad
+
+
+def bytes_por_producto(clase, filas):
+    tracemalloc.start()
+    antes = tracemalloc.take_snapshot()
+    productos = [clase(*fila) for fila in filas]
+    despues = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    usados = sum(
+        diferencia.size_diff
+        for diferencia in despues.compare_to(antes, 'filename')
+    )
+    return usados / len(productos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--productos', type=int, default=100_000)
+    args = parser.parse_args()
+
+    # Las filas ya existen antes de medir: solo cuenta el objeto Producto
+    # y su contenedor, no los valores que trae sqlite3
+    filas = [(i, f'Producto {i}', 9.99, 10) for i in range(args.productos)]
+    con_dict = bytes_por_producto(ProductoConDict, filas)
+    con_slots = bytes_por_producto(Producto, filas)
+    print(f"Productos: {args.productos}")
+    print(f"Con __dict__:  {con_dict:.1f} bytes/producto")
+    print(f"Con __slots__: {con_slots:.1f} bytes/producto")
+    print(f"Ahorro: {100 * (1 - con_slots / con_dict):.1f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Verifica que las consultas de rango sobre ventas usan un índice.
+
+Uso (desde la raíz del repositorio):
+
+    python -m benchmarks.planes_consultas
+    python -m benchmarks.planes_consultas --ruta grande.db
+
+Muestra el EXPLAIN QUERY PLAN de cada consulta de CONSULTAS_RANGO_VENTAS y
+sale con código 1 si alguna recorre ventas con SCAN, aunque sea sobre un
+índice cubriente. Sin --ruta usa una base temporal generada con
+benchmarks.generar_datos; con --ruta trabaja sobre una copia.
+"""
+import argparse
+import os
+import sys
+import tempfile
+from contextlib import redirect_stdout
+
+from app import CONSULTAS_RANGO_VENTAS, InventarioCajaApp, rango_dia
+from benchmarks.generar_datos import generar
+from benchmarks.rendimiento import copiar_base
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ruta', help='base existente (se trabaja sobre una copia)')
+    parser.add_argument('--productos', type=int, default=200)
+    parser.add_argument('--ventas', type=int, default=10_000)
+    args = parser.parse_args()
+
+    directorio = tempfile.TemporaryDirectory()
+    ruta = os.path.join(directorio.name, 'planes.db')
+    # Los avisos de las migraciones no aportan al resultado
+    with open(os.devnull, 'w') as nulo, redirect_stdout(nulo):
+        if args.ruta:
+            copiar_base(args.ruta, ruta)
+        else:
+            generar(ruta, args.productos, args.ventas)
+        app = InventarioCajaApp(ruta)
+    desde, hasta = rango_dia()
+    for nombre, sql in CONSULTAS_RANGO_VENTAS.items():
+        print(nombre)
+        for paso in app.explicar_consulta(sql, (desde, hasta)):
+            print(f'    {paso}')
+    escaneos = app.consultas_con_escaneo_completo()
+    app.cerrar()
+    directorio.cleanup()
+
+    if escaneos:
+        print(f"FALLA: recorren ventas completa: {', '.join(escaneos)}")
+        sys.exit(1)
+    print(f'OK: las {len(CONSULTAS_RANGO_VENTAS)} consultas buscan en un índice')
+
+
+if __name__ == '__main__':
+    main()
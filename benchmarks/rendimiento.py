@@ -0,0 +1,156 @@
+"""Mide latencia, rendimiento y memoria pico de los métodos de InventarioCajaApp.
+
+Uso (desde la raíz del repositorio):
+
+    python -m benchmarks.rendimiento --ruta grande.db --salida resultados.json
+    python -m benchmarks.rendimiento --productos 1000 --ventas 100000 --comparar resultados.json
+
+Sin --ruta genera una base temporal con benchmarks.generar_datos. Las
+escrituras se hacen sobre una copia, así la base indicada no se modifica.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from app import TAMANO_PAGINA, InventarioCajaApp, construir_tarjeta
+from benchmarks.generar_datos import generar
+
+
+def copiar_base(origen, destino):
+    # backup() incluye lo que todavía esté en el WAL
+    with sqlite3.connect(origen) as fuente, sqlite3.connect(destino) as copia:
+        fuente.backup(copia)
+
+
+def medir(operacion, repeticiones):
+    latencias = []
+    inicio_total = time.perf_counter()
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        operacion()
+        latencias.append(time.perf_counter() - inicio)
+    duracion = time.perf_counter() - inicio_total
+
+    # La memoria se mide en una ejecución aparte: tracemalloc distorsiona
+    # los tiempos
+    tracemalloc.start()
+    operacion()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencias.sort()
+    return {
+        'repeticiones': repeticiones,
+        'p50_ms': statistics.median(latencias) * 1000,
+        'p99_ms': latencias[min(len(latencias) - 1, int(len(latencias) * 0.99))] * 1000,
+        'media_ms': statistics.fmean(latencias) * 1000,
+        'ops_por_segundo': repeticiones / duracion if duracion else None,
+        'memoria_pico_kb': pico / 1024,
+    }
+
+
+def operaciones(app, directorio):
+    productos = app.obtener_productos()
+    ids = [producto.id for producto in productos]
+    precios = {producto.id: producto.precio for producto in productos}
+    siguiente = iter(range(10 ** 9))
+    reporte = os.path.join(directorio, 'reporte.csv')
+
+    def obtener_productos_frio():
+        app.invalidar_cache()
+        app.obtener_productos()
+
+    def registrar_venta():
+        id = ids[next(siguiente) % len(ids)]
+        app.registrar_venta(id, 1, precios[id], 'efectivo')
+
+    def construir_tarjetas():
+        # Lo que hace actualizar_lista_productos sin la página de Flet:
+        # leer la ventana visible y construir una tarjeta por producto
+        for producto in app.obtener_productos_pagina(0, TAMANO_PAGINA):
+            construir_tarjeta(producto, None, None, None)
+
+    # (nombre, operación, repeticiones relativas a --repeticiones)
+    return [
+        ('obtener_productos', app.obtener_productos, 1),
+        ('obtener_productos_frio', obtener_productos_frio, 0.1),
+        ('registrar_venta', registrar_venta, 1),
+        ('obtener_cuadre_caja', app.obtener_cuadre_caja, 1),
+        ('obtener_totales_por_metodo_pago', app.obtener_totales_por_metodo_pago, 1),
+        ('generar_reporte_csv', lambda: app.generar_reporte_csv(reporte), 0.02),
+        ('construir_tarjetas', construir_tarjetas, 0.1),
+    ]
+
+
+def comparar(actual, anterior):
+    # Va a stderr para no mezclarse con el JSON cuando sale por stdout
+    print(f"{'operación':34} {'p50 antes':>11} {'p50 ahora':>11} {'cambio':>8}",
+          file=sys.stderr)
+    for nombre, medida in actual['resultados'].items():
+        previa = anterior['resultados'].get(nombre)
+        if not previa:
+            continue
+        cambio = medida['p50_ms'] / previa['p50_ms'] - 1 if previa['p50_ms'] else 0
+        print(f"{nombre:34} {previa['p50_ms']:>9.3f}ms {medida['p50_ms']:>9.3f}ms "
+              f"{cambio * 100:>+7.1f}%", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ruta', help='base existente (por defecto se genera una temporal)')
+    parser.add_argument('--productos', type=int, default=1_000)
+    parser.add_argument('--ventas', type=int, default=100_000)
+    parser.add_argument('--repeticiones', type=int, default=1_000)
+    parser.add_argument('--salida', help='archivo JSON de resultados (por defecto stdout)')
+    parser.add_argument('--comparar', help='JSON de una corrida anterior')
+    args = parser.parse_args()
+
+    directorio = tempfile.TemporaryDirectory()
+    ruta = os.path.join(directorio.name, 'rendimiento.db')
+    # Los mensajes de la app (migraciones, errores) no deben ensuciar el JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        if args.ruta:
+            copiar_base(args.ruta, ruta)
+        else:
+            generar(ruta, args.productos, args.ventas)
+
+        app = InventarioCajaApp(ruta)
+        with app._lector() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM productos')
+            productos = cursor.fetchone()[0]
+            cursor.execute('SELECT COUNT(*) FROM ventas')
+            ventas = cursor.fetchone()[0]
+        resultados = {}
+        for nombre, operacion, factor in operaciones(app, directorio.name):
+            resultados[nombre] = medir(operacion, max(1, int(args.repeticiones * factor)))
+        app.cerrar()
+    directorio.cleanup()
+
+    informe = {
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'base': {'ruta': args.ruta, 'productos': productos, 'ventas': ventas},
+        'resultados': resultados,
+    }
+    texto = json.dumps(informe, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as file:
+            file.write(texto + '\n')
+    else:
+        print(texto)
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as file:
+            comparar(informe, json.load(file))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Comprueba que las ventas siguen confirmando mientras corre un respaldo en línea.
+
+Uso (desde la raíz del repositorio):
+
+    python -m benchmarks.respaldo_en_linea --productos 10000 --ventas 2000000
+    python -m benchmarks.respaldo_en_linea --ruta grande.db --comprimir
+
+Mide la latencia de registrar_ticket sin respaldo y después mientras un
+respaldo de la base corre en otro hilo del mismo proceso, como en la app.
+Restaura el respaldo en un archivo nuevo y verifica que esté completo. Sale
+con código 1 si el p99 durante el respaldo supera --tolerancia veces el p99
+base (y al menos --margen-ms más) o si la restauración no es coherente.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from app import FORMATO_FECHA, InventarioCajaApp
+from benchmarks.generar_datos import METODOS_PAGO, generar
+from benchmarks.rendimiento import copiar_base
+from respaldo import Respaldos, restaurar
+
+STOCK_EXTRA = 1_000_000
+
+
+def vender(app, ids, aleatorio, continuar):
+    latencias = []
+    while continuar():
+        lineas = [
+            (aleatorio.choice(ids), 1) for _ in range(aleatorio.randint(1, 3))
+        ]
+        inicio = time.perf_counter()
+        app.registrar_ticket(lineas, aleatorio.choice(METODOS_PAGO))
+        latencias.append(time.perf_counter() - inicio)
+    return latencias
+
+
+def resumir(latencias, duracion):
+    latencias.sort()
+    return {
+        'tickets': len(latencias),
+        'por_segundo': len(latencias) / duracion if duracion else 0,
+        'p50_ms': statistics.median(latencias) * 1000,
+        'p99_ms': latencias[min(len(latencias) - 1, int(len(latencias) * 0.99))] * 1000,
+        'maximo_ms': latencias[-1] * 1000,
+    }
+
+
+def contar_ventas(app):
+    with app._lector() as cursor:
+        cursor.execute('SELECT COUNT(*) FROM ventas')
+        return cursor.fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ruta', help='base existente (se trabaja sobre una copia)')
+    parser.add_argument('--productos', type=int, default=10_000)
+    parser.add_argument('--ventas', type=int, default=1_000_000)
+    parser.add_argument('--segundos', type=float, default=5,
+                        help='duración de la medición sin respaldo')
+    parser.add_argument('--comprimir', action='store_true')
+    parser.add_argument('--tolerancia', type=float, default=3.0)
+    parser.add_argument('--margen-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    directorio = tempfile.TemporaryDirectory()
+    ruta = os.path.join(directorio.name, 'respaldo.db')
+    if args.ruta:
+        copiar_base(args.ruta, ruta)
+    else:
+        print(f'Generando {args.productos} productos y {args.ventas} ventas...')
+        generar(ruta, args.productos, args.ventas)
+    print(f'Base: {os.path.getsize(ruta) / 1024 ** 2:.1f} MB')
+
+    app = InventarioCajaApp(ruta)
+    # Stock de sobra, con su ajuste en el kardex, para que ningún ticket
+    # falle durante la prueba
+    with app._transaccion() as cursor:
+        cursor.execute('UPDATE productos SET cantidad = cantidad + ?', (STOCK_EXTRA,))
+        cursor.execute('''
+            INSERT INTO movimientos (producto_id, fecha, tipo, cantidad, precio)
+            SELECT id, ?, 'ajuste', ?, precio FROM productos
+        ''', (datetime.now().strftime(FORMATO_FECHA), STOCK_EXTRA))
+    app.invalidar_cache()
+    ids = [producto.id for producto in app.obtener_productos()]
+    aleatorio = random.Random(0)
+
+    inicio = time.perf_counter()
+    fin = inicio + args.segundos
+    base = resumir(
+        vender(app, ids, aleatorio, lambda: time.perf_counter() < fin),
+        time.perf_counter() - inicio,
+    )
+
+    respaldos = Respaldos(
+        app, os.path.join(directorio.name, 'respaldos'), comprimir=args.comprimir
+    )
+    ventas_antes = contar_ventas(app)
+    resultado = []
+    hilo = threading.Thread(target=lambda: resultado.append(respaldos.respaldar()))
+    inicio = time.perf_counter()
+    hilo.start()
+    durante = vender(app, ids, aleatorio, hilo.is_alive)
+    duracion = time.perf_counter() - inicio
+    hilo.join()
+    ventas_despues = contar_ventas(app)
+    durante = resumir(durante, duracion) if durante else None
+    app.cerrar()
+
+    fallas = []
+    copia = resultado[0]
+    if copia is None:
+        fallas.append('el respaldo falló')
+    else:
+        print(f'Respaldo: {os.path.basename(copia)} '
+              f'{os.path.getsize(copia) / 1024 ** 2:.1f} MB en {duracion:.2f}s')
+        restaurada = os.path.join(directorio.name, 'restaurada.db')
+        if not restaurar(copia, restaurada):
+            fallas.append('la restauración falló')
+        else:
+            app = InventarioCajaApp(restaurada)
+            ventas_copia = contar_ventas(app)
+            if not ventas_antes <= ventas_copia <= ventas_despues:
+                fallas.append(
+                    f'el respaldo tiene {ventas_copia} ventas, se esperaban entre '
+                    f'{ventas_antes} y {ventas_despues}'
+                )
+            if app.verificar_existencias():
+                fallas.append('el respaldo tiene existencias descuadradas con el kardex')
+            app.cerrar()
+
+    print(f"{'':22} {'tickets/s':>10} {'p50':>9} {'p99':>9} {'máximo':>9}")
+    for nombre, medida in (('sin respaldo', base), ('durante el respaldo', durante)):
+        if medida:
+            print(f"{nombre:22} {medida['por_segundo']:>10.0f} {medida['p50_ms']:>7.2f}ms "
+                  f"{medida['p99_ms']:>7.2f}ms {medida['maximo_ms']:>7.2f}ms")
+    if durante is None:
+        print('El respaldo terminó antes de la primera venta; use una base más grande')
+    elif durante['p99_ms'] > max(base['p99_ms'] * args.tolerancia,
+                                 base['p99_ms'] + args.margen_ms):
+        fallas.append('la latencia de las ventas empeoró durante el respaldo')
+    directorio.cleanup()
+
+    for falla in fallas:
+        print(f'FALLA: {falla}')
+    if fallas:
+        sys.exit(1)
+    print('OK: las ventas siguieron confirmando durante el respaldo')
+
+
+if __name__ == '__main__':
+    main()
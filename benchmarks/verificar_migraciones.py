@@ -0,0 +1,200 @@
+"""Verifica que las migraciones actualizan bases existentes sin perder ventas.
+
+Uso (desde la raíz del repositorio):
+
+    python -m benchmarks.verificar_migraciones --ventas 20000
+
+Arma una base con el esquema original (productos y ventas con
+metodo_pago), otra anterior a metodo_pago y una por cada versión
+intermedia del esquema. Las abre con InventarioCajaApp y comprueba que
+user_version quede al día, que productos y ventas no cambien y que los
+resúmenes coincidan con las ventas. Sale con código 1 ante cualquier falla.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+from contextlib import closing, redirect_stdout
+from datetime import datetime, timedelta
+
+from app import FORMATO_FECHA, InventarioCajaApp
+from benchmarks.generar_datos import METODOS_PAGO
+
+# Esquema de la versión 0, tal como lo creaba crear_tablas antes de las
+# migraciones; el legado es el de antes de la columna metodo_pago
+ESQUEMA_BASE = '''
+    CREATE TABLE productos (
+        id INTEGER PRIMARY KEY,
+        nombre TEXT NOT NULL,
+        precio REAL NOT NULL,
+        cantidad INTEGER NOT NULL
+    );
+    CREATE TABLE ventas (
+        id INTEGER PRIMARY KEY,
+        producto_id INTEGER,
+        cantidad INTEGER,
+        total REAL,
+        metodo_pago TEXT,
+        fecha TEXT,
+        FOREIGN KEY (producto_id) REFERENCES productos (id)
+    );
+'''
+ESQUEMA_LEGADO = '''
+    CREATE TABLE productos (
+        id INTEGER PRIMARY KEY,
+        nombre TEXT NOT NULL,
+        precio REAL NOT NULL,
+        cantidad INTEGER NOT NULL
+    );
+    CREATE TABLE ventas (
+        id INTEGER PRIMARY KEY,
+        producto_id INTEGER,
+        cantidad INTEGER,
+        total REAL,
+        fecha TEXT,
+        FOREIGN KEY (producto_id) REFERENCES productos (id)
+    );
+'''
+
+
+def construir(ruta, legado, productos, ventas, semilla=0):
+    # Devuelve las filas insertadas para compararlas después de migrar
+    aleatorio = random.Random(semilla)
+    filas_productos = [
+        (i, f'Producto {i}', round(aleatorio.uniform(1, 500), 2), aleatorio.randint(0, 100))
+        for i in range(1, productos + 1)
+    ]
+    inicio = datetime.now().replace(microsecond=0) - timedelta(days=400)
+    filas_ventas = []
+    for i in range(1, ventas + 1):
+        producto = aleatorio.choice(filas_productos)
+        cantidad = aleatorio.randint(1, 5)
+        fecha = inicio + timedelta(seconds=aleatorio.randrange(400 * 86400))
+        filas_ventas.append((
+            i,
+            producto[0],
+            cantidad,
+            round(producto[2] * cantidad, 2),
+            None if legado else aleatorio.choice(METODOS_PAGO),
+            fecha.strftime(FORMATO_FECHA),
+        ))
+    with closing(sqlite3.connect(ruta)) as conn, conn:
+        conn.executescript(ESQUEMA_LEGADO if legado else ESQUEMA_BASE)
+        conn.executemany('INSERT INTO productos VALUES (?, ?, ?, ?)', filas_productos)
+        if legado:
+            conn.executemany(
+                'INSERT INTO ventas (id, producto_id, cantidad, total, fecha) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [(id, p, c, t, f) for id, p, c, t, _, f in filas_ventas]
+            )
+        else:
+            conn.executemany('INSERT INTO ventas VALUES (?, ?, ?, ?, ?, ?)', filas_ventas)
+    return filas_productos, filas_ventas
+
+
+def migrar_hasta(ruta, version):
+    # Abre la base con las primeras `version` migraciones, como lo haría una
+    # versión anterior de la app
+    class AppAnterior(InventarioCajaApp):
+        MIGRACIONES = InventarioCajaApp.MIGRACIONES[:version]
+
+        def _tomar_instantanea_si_corresponde(self):
+            # Antes de _migracion_movimientos no hay kardex y antes de
+            # _migracion_instantaneas_parciales las instantáneas no tienen base
+            if '_migracion_instantaneas_parciales' in self.MIGRACIONES:
+                super()._tomar_instantanea_si_corresponde()
+
+    AppAnterior(ruta).cerrar()
+
+
+def verificar(ruta, filas_productos, filas_ventas):
+    fallas = []
+    app = InventarioCajaApp(ruta)
+    with app._lector() as cursor:
+        cursor.execute('PRAGMA user_version')
+        version = cursor.fetchone()[0]
+        if version != len(InventarioCajaApp.MIGRACIONES):
+            fallas.append(f'user_version {version}, se esperaba {len(app.MIGRACIONES)}')
+        cursor.execute('SELECT id, nombre, precio, cantidad FROM productos ORDER BY id')
+        if cursor.fetchall() != filas_productos:
+            fallas.append('los productos cambiaron')
+        cursor.execute(
+            'SELECT id, producto_id, cantidad, total, metodo_pago, fecha FROM ventas ORDER BY id'
+        )
+        if cursor.fetchall() != filas_ventas:
+            fallas.append('las ventas cambiaron')
+
+        # Resúmenes esperados calculados en Python desde las filas originales
+        por_dia = {}
+        for _, _, cantidad, total, metodo_pago, fecha in filas_ventas:
+            clave = (fecha[:10], metodo_pago or '')
+            ventas, suma, unidades = por_dia.get(clave, (0, 0, 0))
+            por_dia[clave] = (ventas + 1, suma + total, unidades + cantidad)
+        cursor.execute(
+            'SELECT dia, metodo_pago, ventas, total, unidades FROM resumen_diario'
+        )
+        resumen = {(dia, metodo): (v, t, u) for dia, metodo, v, t, u in cursor.fetchall()}
+        if resumen.keys() != por_dia.keys() or any(
+            resumen[clave][0] != v or resumen[clave][2] != u
+            or abs(resumen[clave][1] - t) > 0.01
+            for clave, (v, t, u) in por_dia.items()
+        ):
+            fallas.append('resumen_diario no coincide con las ventas')
+    total = sum(fila[3] for fila in filas_ventas)
+    if abs(sum(app.obtener_totales_por_metodo_pago().values()) - total) > 0.01:
+        fallas.append('resumen_metodo_pago no coincide con las ventas')
+    if abs(app.obtener_total_ventas('', '9999') - total) > 0.01:
+        fallas.append('obtener_total_ventas no coincide con las ventas')
+    if not app.verificar_valor_inventario()[2]:
+        fallas.append('valor_inventario no coincide con productos')
+    if app.verificar_existencias():
+        fallas.append('el kardex no coincide con el stock')
+    app.cerrar()
+
+    # Una base al día se abre sin volver a migrar: crear_tablas solo lee
+    # user_version y no abre ninguna transacción
+    app = InventarioCajaApp(ruta)
+    if app.conn.total_changes:
+        fallas.append('la segunda apertura volvió a escribir en la base')
+    app.cerrar()
+    return fallas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--productos', type=int, default=200)
+    parser.add_argument('--ventas', type=int, default=20_000)
+    args = parser.parse_args()
+
+    casos = [('esquema original', False, 0), ('anterior a metodo_pago', True, 0)]
+    casos += [
+        (f'versión {version} ({InventarioCajaApp.MIGRACIONES[version - 1]})', False, version)
+        for version in range(1, len(InventarioCajaApp.MIGRACIONES))
+    ]
+    directorio = tempfile.TemporaryDirectory()
+    fallidos = 0
+    for i, (nombre, legado, version) in enumerate(casos):
+        ruta = os.path.join(directorio.name, f'migracion_{i}.db')
+        filas_productos, filas_ventas = construir(
+            ruta, legado, args.productos, args.ventas, semilla=i
+        )
+        # Los avisos de cada migración no aportan al resultado
+        with open(os.devnull, 'w') as nulo, redirect_stdout(nulo):
+            if version:
+                migrar_hasta(ruta, version)
+            fallas = verificar(ruta, filas_productos, filas_ventas)
+        print(f"{'OK   ' if not fallas else 'FALLA'} {nombre}")
+        for falla in fallas:
+            print(f'      {falla}')
+        fallidos += bool(fallas)
+    directorio.cleanup()
+    if fallidos:
+        print(f'{fallidos} de {len(casos)} casos fallaron')
+        sys.exit(1)
+    print(f'{len(casos)} casos migrados sin pérdida de datos')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+import asyncio
+import bisect
+import functools
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+# Límites superiores de los cubos de cada histograma; el último cubo junta
+# todo lo que supera el mayor límite
+LIMITES_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+LIMITES_CONTROLES = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+LARGO_CLAVE_CONSULTA = 120
+
+
+class Histograma:
+    __slots__ = ('limites', 'cubos', 'cantidad', 'suma', 'maximo')
+
+    def __init__(self, limites=LIMITES_MS):
+        self.limites = limites
+        self.cubos = [0] * (len(limites) + 1)
+        self.cantidad = 0
+        self.suma = 0
+        self.maximo = 0
+
+    def registrar(self, valor):
+        self.cubos[bisect.bisect_left(self.limites, valor)] += 1
+        self.cantidad += 1
+        self.suma += valor
+        if valor > self.maximo:
+            self.maximo = valor
+
+    def percentil(self, p):
+        # Aproximado: el límite superior del cubo donde cae el percentil
+        objetivo = self.cantidad * p
+        acumulado = 0
+        for limite, cubo in zip(self.limites + (self.maximo,), self.cubos):
+            acumulado += cubo
+            if cubo and acumulado >= objetivo:
+                return min(limite, self.maximo)
+        return self.maximo
+
+    def a_dict(self):
+        return {
+            'cantidad': self.cantidad,
+            'suma': self.suma,
+            'media': self.suma / self.cantidad if self.cantidad else 0,
+            'p50': self.percentil(0.5),
+            'p99': self.percentil(0.99),
+            'maximo': self.maximo,
+            'limites': list(self.limites),
+            'cubos': list(self.cubos),
+        }
+
+
+class Diagnostico:
+    # Registro de tiempos de consultas, manejadores de eventos y
+    # actualizaciones de la página. Desactivado, cada punto de medición se
+    # reduce a leer `activo`.
+    def __init__(self):
+        self.activo = False
+        self._bloqueo = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self._bloqueo:
+            self.consultas = {}
+            self.manejadores = {}
+            self.actualizaciones = Histograma(LIMITES_CONTROLES)
+            self.desde = datetime.now()
+
+    def registrar(self, grupo, clave, valor):
+        with self._bloqueo:
+            histograma = grupo.get(clave)
+            if histograma is None:
+                histograma = grupo[clave] = Histograma()
+            histograma.registrar(valor)
+
+    def registrar_actualizacion(self, controles):
+        with self._bloqueo:
+            self.actualizaciones.registrar(controles)
+
+    def resumen(self):
+        with self._bloqueo:
+            return {
+                'desde': self.desde.isoformat(timespec='seconds'),
+                'hasta': datetime.now().isoformat(timespec='seconds'),
+                'consultas_ms': {
+                    clave: h.a_dict() for clave, h in self.consultas.items()
+                },
+                'manejadores_ms': {
+                    clave: h.a_dict() for clave, h in self.manejadores.items()
+                },
+                'actualizaciones_controles': self.actualizaciones.a_dict(),
+            }
+
+    def volcar(self, filename):
+        try:
+            with open(filename, 'w', encoding='utf-8') as file:
+                json.dump(self.resumen(), file, indent=2, ensure_ascii=False)
+            return True
+        except IOError as e:
+            print(f"Error al guardar el diagnóstico: {e}")
+            return False
+
+
+diagnostico = Diagnostico()
+
+
+def clave_consulta(sql):
+    return ' '.join(sql.split())[:LARGO_CLAVE_CONSULTA]
+
+
+class CursorMedido(sqlite3.Cursor):
+    # Mide el paso de ejecución de cada sentencia; las filas que se leen
+    # después con fetch* no entran en la medición
+    def execute(self, sql, parametros=()):
+        if not diagnostico.activo:
+            return super().execute(sql, parametros)
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, parametros)
+        finally:
+            diagnostico.registrar(
+                diagnostico.consultas,
+                clave_consulta(sql),
+                (time.perf_counter() - inicio) * 1000,
+            )
+
+    def executemany(self, sql, parametros):
+        if not diagnostico.activo:
+            return super().executemany(sql, parametros)
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, parametros)
+        finally:
+            diagnostico.registrar(
+                diagnostico.consultas,
+                clave_consulta(sql),
+                (time.perf_counter() - inicio) * 1000,
+            )
+
+
+class ConexionMedida(sqlite3.Connection):
+    # Fábrica para sqlite3.connect: todos los cursores, también los que
+    # crea Connection.execute, pasan por CursorMedido
+    def cursor(self, factory=CursorMedido):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, parametros):
+        return self.cursor().executemany(sql, parametros)
+
+
+def medir_manejador(funcion):
+    nombre = funcion.__name__
+    if asyncio.iscoroutinefunction(funcion):
+        @functools.wraps(funcion)
+        async def envoltura_async(*args, **kwargs):
+            if not diagnostico.activo:
+                return await funcion(*args, **kwargs)
+            inicio = time.perf_counter()
+            try:
+                return await funcion(*args, **kwargs)
+            finally:
+                diagnostico.registrar(
+                    diagnostico.manejadores,
+                    nombre,
+                    (time.perf_counter() - inicio) * 1000,
+                )
+        return envoltura_async
+
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        if not diagnostico.activo:
+            return funcion(*args, **kwargs)
+        inicio = time.perf_counter()
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            diagnostico.registrar(
+                diagnostico.manejadores,
+                nombre,
+                (time.perf_counter() - inicio) * 1000,
+            )
+    return envoltura
+
+
+def contar_controles(control):
+    # Tamaño aproximado de lo que envía una actualización: el control y
+    # todos sus descendientes
+    total = 0
+    pendientes = [control]
+    while pendientes:
+        actual = pendientes.pop()
+        total += 1
+        hijos = getattr(actual, '_get_children', None)
+        if hijos is not None:
+            pendientes.extend(hijos())
+    return total
+
+
+def medir_actualizaciones(page):
+    # Envuelve page.update; Control.update() también pasa por aquí
+    actualizar = page.update
+
+    @functools.wraps(actualizar)
+    def envoltura(*controles):
+        if diagnostico.activo:
+            diagnostico.registrar_actualizacion(
+                sum(contar_controles(c) for c in (controles or (page,)))
+            )
+        return actualizar(*controles)
+
+    page.update = envoltura
+
+
+def barras(cubos):
+    # Histograma en una línea de texto, escalado al cubo más lleno
+    niveles = ' ▁▂▃▄▅▆▇█'
+    mayor = max(cubos) or 1
+    return ''.join(
+        niveles[-1 if cubo == mayor else (cubo * (len(niveles) - 1)) // mayor]
+        for cubo in cubos
+    )
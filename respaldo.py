@@ -0,0 +1,245 @@
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+import threading
+from datetime import datetime
+
+# Cada paso copia PAGINAS_POR_PASO páginas (4 MB con páginas de 4 KB) y
+# después cede PAUSA_ENTRE_PASOS segundos de E/S a la app
+PAGINAS_POR_PASO = 1024
+PAUSA_ENTRE_PASOS = 0.005
+RESPALDOS_CONSERVADOS = 7
+INTERVALO_RESPALDO_MIN = 60
+TIEMPO_ESPERA_BLOQUEO = 10
+FORMATO_MARCA = '%Y%m%d_%H%M%S'
+
+
+class RespaldoCancelado(Exception):
+    pass
+
+
+def abrir_instantanea(ruta):
+    # Conexión con una transacción de lectura abierta. En WAL eso fija una
+    # instantánea: la API de respaldo copia desde ella y las ventas que se
+    # confirman mientras tanto no la obligan a empezar de nuevo. Mientras
+    # dure, el checkpoint no puede reciclar el WAL, que crece un poco.
+    conn = sqlite3.connect(
+        ruta, timeout=TIEMPO_ESPERA_BLOQUEO, isolation_level=None, check_same_thread=False
+    )
+    try:
+        conn.execute('BEGIN')
+        conn.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        return conn
+    except sqlite3.Error:
+        conn.close()
+        raise
+
+
+def verificar_integridad(ruta):
+    # Se cierra antes de mover el archivo: al cerrar la última conexión
+    # SQLite vuelca y borra el -wal que crea la copia
+    conn = sqlite3.connect(ruta)
+    try:
+        return conn.execute('PRAGMA quick_check').fetchone()[0] == 'ok'
+    finally:
+        conn.close()
+
+
+def comprimir_archivo(origen, destino):
+    with open(origen, 'rb') as entrada, gzip.open(destino, 'wb', compresslevel=6) as salida:
+        shutil.copyfileobj(entrada, salida, 1024 * 1024)
+    os.remove(origen)
+
+
+def borrar_si_existe(ruta):
+    try:
+        os.remove(ruta)
+    except FileNotFoundError:
+        pass
+
+
+class Respaldos:
+    # Respaldos en línea con la API de respaldo de SQLite desde conexiones
+    # propias, así la copia no toma la conexión escritora ni el bloqueo de
+    # la app y las ventas siguen confirmando mientras avanza. Cada respaldo
+    # es la base más sus meses archivados con el mismo sello de tiempo; se
+    # conservan los últimos `conservar`.
+    def __init__(self, app, directorio=None, conservar=RESPALDOS_CONSERVADOS, comprimir=True):
+        self.app = app
+        self.directorio = directorio or os.path.join(
+            os.path.dirname(os.path.abspath(app.ruta)), 'respaldos'
+        )
+        self.base = os.path.splitext(os.path.basename(app.ruta))[0]
+        self.conservar = conservar
+        self.comprimir = comprimir
+        self._patron = re.compile(
+            re.escape(self.base)
+            + r'_(\d{8}_\d{6})(?:_ventas_\d{4}-\d{2})?\.db(?:\.gz)?(?:\.parcial)?$'
+        )
+        self._en_curso = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def listar(self):
+        # Respaldos completos, del más reciente al más antiguo
+        if not os.path.isdir(self.directorio):
+            return []
+        return sorted(
+            (
+                os.path.join(self.directorio, nombre)
+                for nombre in os.listdir(self.directorio)
+                if re.fullmatch(re.escape(self.base) + r'_\d{8}_\d{6}\.db(?:\.gz)?', nombre)
+            ),
+            reverse=True,
+        )
+
+    def respaldar(self, progreso=None):
+        # Devuelve la ruta del respaldo de la base, o None si falló o ya
+        # había otro en curso
+        if not self._en_curso.acquire(blocking=False):
+            print("Ya hay un respaldo en curso")
+            return None
+        fuentes = []
+        parciales = []
+        try:
+            os.makedirs(self.directorio, exist_ok=True)
+            prefijo = os.path.join(
+                self.directorio, f'{self.base}_{datetime.now():{FORMATO_MARCA}}'
+            )
+            # Las instantáneas de la base y de los meses archivados se abren
+            # juntas bajo el bloqueo que también toma archivar_ventas: ningún
+            # mes queda a medio mover entre una y otra
+            with self.app._bloqueo:
+                self.app.confirmar_pendientes()
+                fuentes.append((abrir_instantanea(self.app.ruta), f'{prefijo}.db'))
+                for mes in self.app.meses_archivados():
+                    fuentes.append((
+                        abrir_instantanea(f'{self.app._ruta_archivo(mes)}.db'),
+                        f'{prefijo}_ventas_{mes}.db',
+                    ))
+            total = sum(
+                fuente.execute('PRAGMA page_count').fetchone()[0] for fuente, _ in fuentes
+            )
+            hechos = 0
+            for fuente, destino in fuentes:
+                parcial = f'{destino}.parcial'
+                parciales.append(parcial)
+                hechos = self._copiar(fuente, parcial, hechos, total, progreso)
+                fuente.close()
+                if not verificar_integridad(parcial):
+                    raise sqlite3.DatabaseError(f'La copia {parcial} no pasó quick_check')
+                if self.comprimir:
+                    comprimido = f'{destino}.gz.parcial'
+                    parciales[-1] = comprimido
+                    comprimir_archivo(parcial, comprimido)
+            # La base se renombra al final: un respaldo aparece en listar()
+            # solo cuando todos sus archivos están completos
+            finales = [parcial[:-len('.parcial')] for parcial in parciales]
+            for parcial, final in reversed(list(zip(parciales, finales))):
+                os.replace(parcial, final)
+            self.rotar()
+            return finales[0]
+        except (sqlite3.Error, OSError, RespaldoCancelado) as e:
+            print(f"Error al respaldar la base de datos: {e}")
+            for parcial in parciales:
+                borrar_si_existe(parcial)
+                borrar_si_existe(parcial.replace('.gz.parcial', '.parcial'))
+            return None
+        finally:
+            for fuente, _ in fuentes:
+                fuente.close()
+            self._en_curso.release()
+
+    def _copiar(self, fuente, destino, hechos, total, progreso):
+        def al_avanzar(estado, restantes, paginas):
+            if self._detener.is_set():
+                raise RespaldoCancelado('respaldo cancelado al cerrar')
+            if progreso is not None:
+                progreso(hechos + paginas - restantes, total)
+
+        copia = sqlite3.connect(destino)
+        try:
+            fuente.backup(
+                copia, pages=PAGINAS_POR_PASO, progress=al_avanzar, sleep=PAUSA_ENTRE_PASOS
+            )
+        finally:
+            copia.close()
+        return hechos + fuente.execute('PRAGMA page_count').fetchone()[0]
+
+    def rotar(self):
+        # Borra los respaldos que exceden `conservar`, junto con sus meses
+        # archivados y lo que haya dejado un respaldo interrumpido
+        marcas = {
+            self._patron.match(os.path.basename(ruta)).group(1)
+            for ruta in self.listar()[:self.conservar]
+        }
+        for nombre in os.listdir(self.directorio):
+            coincidencia = self._patron.match(nombre)
+            if coincidencia is not None and coincidencia.group(1) not in marcas:
+                borrar_si_existe(os.path.join(self.directorio, nombre))
+
+    def iniciar(self, intervalo_min=INTERVALO_RESPALDO_MIN):
+        # Respaldos programados cada `intervalo_min` minutos en un hilo propio
+        if self._hilo is None:
+            self._detener.clear()
+            self._hilo = threading.Thread(
+                target=self._ciclo,
+                args=(intervalo_min * 60,),
+                name='respaldos',
+                daemon=True,
+            )
+            self._hilo.start()
+
+    def _ciclo(self, intervalo):
+        while not self._detener.wait(intervalo):
+            self.respaldar()
+
+    def cerrar(self):
+        # Un respaldo en curso se cancela en su siguiente paso
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join()
+            self._hilo = None
+
+
+def restaurar(respaldo, destino):
+    # Restaura un respaldo y sus meses archivados en archivos nuevos junto a
+    # `destino`; nunca sobrescribe una base existente
+    prefijo = re.sub(r'\.db(?:\.gz)?$', '', respaldo)
+    base_destino = os.path.splitext(destino)[0]
+    archivos = [(respaldo, destino)]
+    for nombre in sorted(os.listdir(os.path.dirname(os.path.abspath(respaldo)))):
+        coincidencia = re.fullmatch(
+            re.escape(os.path.basename(prefijo)) + r'_ventas_(\d{4}-\d{2})\.db(?:\.gz)?', nombre
+        )
+        if coincidencia is not None:
+            archivos.append((
+                os.path.join(os.path.dirname(respaldo), nombre),
+                f'{base_destino}_ventas_{coincidencia.group(1)}.db',
+            ))
+    parciales = []
+    try:
+        for _, final in archivos:
+            if os.path.exists(final):
+                raise FileExistsError(f'{final} ya existe')
+        for origen, final in archivos:
+            parcial = f'{final}.parcial'
+            parciales.append(parcial)
+            if origen.endswith('.gz'):
+                with gzip.open(origen, 'rb') as entrada, open(parcial, 'wb') as salida:
+                    shutil.copyfileobj(entrada, salida, 1024 * 1024)
+            else:
+                shutil.copyfile(origen, parcial)
+            if not verificar_integridad(parcial):
+                raise sqlite3.DatabaseError(f'{origen} no pasó quick_check')
+        # Los meses primero y la base al final, como en el respaldo
+        for parcial, (_, final) in reversed(list(zip(parciales, archivos))):
+            os.replace(parcial, final)
+        return True
+    except (sqlite3.Error, OSError, EOFError) as e:
+        print(f"Error al restaurar el respaldo: {e}")
+        for parcial in parciales:
+            borrar_si_existe(parcial)
+        return False
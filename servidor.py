@@ -0,0 +1,367 @@
+import argparse
+import asyncio
+import json
+import re
+from datetime import date
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from app import (
+    LIMITE_BUSQUEDA,
+    RUTA_BD,
+    TAMANO_PAGINA,
+    InventarioAsync,
+    InventarioCajaApp,
+)
+
+# Solo se escucha en la interfaz local: no hay autenticación
+HOST = '127.0.0.1'
+PUERTO = 8765
+HILOS_BD = 4
+MAX_CUERPO = 1024 * 1024
+MAX_PAGINA = 500
+MAX_IDS = 1000
+MAX_LOTE = 100
+TIEMPO_INACTIVIDAD = 30
+# Mayor entero que SQLite guarda; uno más grande haría fallar la consulta
+MAX_ENTERO = 2 ** 63 - 1
+METODOS_PAGO = ('efectivo', 'debito', 'credito')
+ESTADOS = {
+    200: 'OK',
+    201: 'Created',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    409: 'Conflict',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+}
+
+# (método, ruta, manejador); los grupos de la ruta se pasan al manejador
+RUTAS = tuple(
+    (metodo, re.compile(patron), manejador)
+    for metodo, patron, manejador in (
+        ('GET', r'/salud', 'salud'),
+        ('GET', r'/productos', 'listar_productos'),
+        ('GET', r'/productos/(\d+)', 'obtener_producto'),
+        ('GET', r'/productos/sku/([^/]+)', 'obtener_por_sku'),
+        ('GET', r'/buscar', 'buscar'),
+        ('POST', r'/tickets', 'cobrar_ticket'),
+        ('GET', r'/resumen', 'resumen'),
+        ('GET', r'/totales', 'totales'),
+        ('POST', r'/lote', 'lote'),
+    )
+)
+
+
+class ErrorHttp(Exception):
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+def producto_a_dict(producto):
+    return {
+        'id': producto.id,
+        'nombre': producto.nombre,
+        'precio': producto.precio,
+        'cantidad': producto.cantidad,
+        'sku': producto.sku,
+    }
+
+
+def entero(parametros, nombre, defecto, minimo=0, maximo=MAX_ENTERO):
+    valor = parametros.get(nombre)
+    if valor is None:
+        return defecto
+    try:
+        valor = int(valor)
+    except ValueError:
+        raise ErrorHttp(400, f"'{nombre}' debe ser un número entero")
+    if not minimo <= valor <= maximo:
+        raise ErrorHttp(400, f"'{nombre}' fuera de rango")
+    return valor
+
+
+def fecha(parametros, nombre):
+    valor = parametros.get(nombre)
+    if valor is None:
+        return None
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise ErrorHttp(400, f"'{nombre}' debe tener el formato AAAA-MM-DD")
+
+
+def respuesta(estado, datos, mantener):
+    cuerpo = json.dumps(datos, ensure_ascii=False).encode('utf-8')
+    cabecera = (
+        f"HTTP/1.1 {estado} {ESTADOS[estado]}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(cuerpo)}\r\n"
+        f"Connection: {'keep-alive' if mantener else 'close'}\r\n"
+        "\r\n"
+    )
+    return cabecera.encode('latin-1') + cuerpo
+
+
+class ServidorInventario:
+    # API JSON sobre HTTP/1.1 con conexiones persistentes. Cada consulta
+    # corre en el pool de hilos de InventarioAsync, con tantas conexiones
+    # lectoras como hilos; las escrituras pasan por la conexión escritora
+    # de la app, que ya las serializa.
+    def __init__(self, app, hilos=HILOS_BD):
+        self.datos = InventarioAsync(app, hilos=hilos)
+        self._en_curso = {}
+
+    def _compartida(self, nombre, *args):
+        # Lecturas idénticas que llegan mientras otra igual está en curso
+        # esperan su resultado en lugar de repetir la consulta
+        clave = (nombre, *args)
+        tarea = self._en_curso.get(clave)
+        if tarea is None:
+            tarea = asyncio.ensure_future(getattr(self.datos, nombre)(*args))
+            self._en_curso[clave] = tarea
+            tarea.add_done_callback(lambda _: self._en_curso.pop(clave, None))
+        # shield: si un cliente se desconecta no se cancela la de los demás
+        return asyncio.shield(tarea)
+
+    async def atender(self, reader, writer):
+        try:
+            while True:
+                try:
+                    linea = await asyncio.wait_for(reader.readline(), TIEMPO_INACTIVIDAD)
+                except asyncio.TimeoutError:
+                    break
+                if not linea:
+                    break
+                try:
+                    metodo, objetivo, version = linea.decode('latin-1').split()
+                except ValueError:
+                    writer.write(respuesta(400, {'error': 'Petición inválida'}, False))
+                    break
+                cabeceras = {}
+                while True:
+                    linea = await reader.readline()
+                    if linea in (b'\r\n', b'\n', b''):
+                        break
+                    nombre, _, valor = linea.decode('latin-1').partition(':')
+                    cabeceras[nombre.strip().lower()] = valor.strip()
+                try:
+                    largo = int(cabeceras.get('content-length') or 0)
+                except ValueError:
+                    largo = -1
+                if largo < 0 or largo > MAX_CUERPO:
+                    writer.write(respuesta(413, {'error': 'Cuerpo inválido o demasiado grande'}, False))
+                    break
+                cuerpo = await reader.readexactly(largo) if largo else b''
+                estado, datos = await self.despachar(metodo, objetivo, cuerpo)
+                mantener = (
+                    version == 'HTTP/1.1'
+                    and cabeceras.get('connection', '').lower() != 'close'
+                )
+                writer.write(respuesta(estado, datos, mantener))
+                await writer.drain()
+                if not mantener:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # ValueError: línea más larga que el límite del StreamReader
+            pass
+        finally:
+            writer.close()
+
+    async def despachar(self, metodo, objetivo, cuerpo=b''):
+        partes = urlsplit(objetivo)
+        ruta = unquote(partes.path).rstrip('/') or '/'
+        parametros = {
+            nombre: valores[-1] for nombre, valores in parse_qs(partes.query).items()
+        }
+        existe = False
+        for metodo_ruta, patron, manejador in RUTAS:
+            coincidencia = patron.fullmatch(ruta)
+            if coincidencia is None:
+                continue
+            existe = True
+            if metodo_ruta != metodo:
+                continue
+            try:
+                if metodo == 'POST':
+                    try:
+                        datos = json.loads(cuerpo or b'{}')
+                    except ValueError:
+                        raise ErrorHttp(400, 'El cuerpo no es JSON válido')
+                    if not isinstance(datos, dict):
+                        raise ErrorHttp(400, 'El cuerpo debe ser un objeto JSON')
+                    return await getattr(self, manejador)(datos, *coincidencia.groups())
+                return await getattr(self, manejador)(parametros, *coincidencia.groups())
+            except ErrorHttp as e:
+                return e.estado, {'error': str(e)}
+            except Exception as e:
+                print(f"Error al atender {metodo} {ruta}: {e!r}")
+                return 500, {'error': 'Error interno'}
+        if existe:
+            return 405, {'error': f'Método {metodo} no permitido en {ruta}'}
+        return 404, {'error': f'No existe {ruta}'}
+
+    async def salud(self, parametros):
+        return 200, {'ok': True}
+
+    async def listar_productos(self, parametros):
+        # Con ?ids=1,2,3 devuelve esos productos en una sola lectura; si no,
+        # una página por clave a partir de ?despues_de
+        if 'ids' in parametros:
+            try:
+                ids = [int(id) for id in parametros['ids'].split(',') if id]
+                if not all(0 <= id <= MAX_ENTERO for id in ids):
+                    raise ValueError
+            except ValueError:
+                raise ErrorHttp(400, "'ids' debe ser una lista de enteros")
+            if len(ids) > MAX_IDS:
+                raise ErrorHttp(400, f'Se admiten hasta {MAX_IDS} ids')
+            productos = await self.datos.obtener_productos_por_ids(ids)
+            encontrados = {producto.id for producto in productos}
+            return 200, {
+                'productos': [producto_a_dict(producto) for producto in productos],
+                'faltantes': [id for id in ids if id not in encontrados],
+            }
+        despues_de = entero(parametros, 'despues_de', 0)
+        limite = entero(parametros, 'limite', TAMANO_PAGINA, 1, MAX_PAGINA)
+        productos = await self.datos.obtener_productos_pagina(despues_de, limite)
+        return 200, {
+            'productos': [producto_a_dict(producto) for producto in productos],
+            'siguiente': productos[-1].id if len(productos) == limite else None,
+        }
+
+    async def obtener_producto(self, parametros, id):
+        producto = await self.datos.obtener_producto(int(id))
+        if producto is None:
+            raise ErrorHttp(404, f'No existe el producto {id}')
+        return 200, producto_a_dict(producto)
+
+    async def obtener_por_sku(self, parametros, sku):
+        producto = await self.datos.buscar_por_sku(sku)
+        if producto is None:
+            raise ErrorHttp(404, f'No existe el código {sku}')
+        return 200, producto_a_dict(producto)
+
+    async def buscar(self, parametros):
+        texto = parametros.get('q', '').strip()
+        if not texto:
+            raise ErrorHttp(400, "Falta el parámetro 'q'")
+        limite = entero(parametros, 'limite', LIMITE_BUSQUEDA, 1, MAX_PAGINA)
+        productos = await self._compartida('buscar_productos', texto, limite)
+        return 200, {'productos': [producto_a_dict(producto) for producto in productos]}
+
+    async def cobrar_ticket(self, datos):
+        # {"lineas": [{"producto_id": 1, "cantidad": 2}, ...], "metodo_pago": "efectivo"}
+        metodo_pago = datos.get('metodo_pago')
+        if metodo_pago not in METODOS_PAGO:
+            raise ErrorHttp(400, f"'metodo_pago' debe ser uno de {', '.join(METODOS_PAGO)}")
+        lineas = []
+        try:
+            for linea in datos.get('lineas') or ():
+                producto_id, cantidad = linea['producto_id'], linea['cantidad']
+                if type(producto_id) is not int or type(cantidad) is not int:
+                    raise ValueError
+                if not (0 < producto_id <= MAX_ENTERO and 0 < cantidad <= MAX_ENTERO):
+                    raise ValueError
+                lineas.append((producto_id, cantidad))
+        except (TypeError, KeyError, ValueError):
+            raise ErrorHttp(400, "Cada línea necesita 'producto_id' y 'cantidad' enteros positivos")
+        if not lineas:
+            raise ErrorHttp(400, 'El ticket no tiene líneas')
+        if not await self.datos.registrar_ticket(lineas, metodo_pago):
+            raise ErrorHttp(409, 'Stock insuficiente o producto inexistente')
+        productos = await self.datos.obtener_productos_por_ids(
+            list(dict.fromkeys(id for id, _ in lineas))
+        )
+        precios = {producto.id: producto.precio for producto in productos}
+        return 201, {
+            'total': sum(precios.get(id, 0) * cantidad for id, cantidad in lineas),
+            'productos': [producto_a_dict(producto) for producto in productos],
+        }
+
+    async def resumen(self, parametros):
+        cuadre, totales, valor = await asyncio.gather(
+            self._compartida('obtener_cuadre_caja'),
+            self._compartida('obtener_totales_por_metodo_pago'),
+            self._compartida('valor_inventario'),
+        )
+        return 200, {
+            'cuadre_hoy': cuadre,
+            'totales_por_metodo_pago': totales,
+            'valor_inventario': valor,
+        }
+
+    async def totales(self, parametros):
+        # Rango semiabierto [desde, hasta); sin ?dia ni rango, el día de hoy
+        dia = fecha(parametros, 'dia')
+        desde, hasta = fecha(parametros, 'desde'), fecha(parametros, 'hasta')
+        if desde is None and hasta is None:
+            cuadre = await self._compartida('obtener_cuadre_caja', dia)
+            return 200, {'dia': (dia or date.today()).isoformat(), 'total': cuadre}
+        desde = desde.isoformat() if desde else None
+        hasta = hasta.isoformat() if hasta else None
+        total, por_metodo = await asyncio.gather(
+            self._compartida('obtener_total_ventas', desde or '', hasta or '9999'),
+            self._compartida('obtener_totales_por_metodo_pago', desde, hasta),
+        )
+        return 200, {
+            'desde': desde,
+            'hasta': hasta,
+            'total': total,
+            'totales_por_metodo_pago': por_metodo,
+        }
+
+    async def lote(self, datos):
+        # {"peticiones": ["/productos/1", "/buscar?q=cafe", ...]}: varias
+        # lecturas en un solo viaje, resueltas en paralelo sobre el pool
+        peticiones = datos.get('peticiones')
+        if not isinstance(peticiones, list) or not all(
+            isinstance(peticion, str) for peticion in peticiones
+        ):
+            raise ErrorHttp(400, "'peticiones' debe ser una lista de rutas")
+        if len(peticiones) > MAX_LOTE:
+            raise ErrorHttp(400, f'Se admiten hasta {MAX_LOTE} peticiones por lote')
+        resultados = await asyncio.gather(*(
+            self.despachar('GET', peticion) for peticion in peticiones
+        ))
+        return 200, {
+            'respuestas': [
+                {'estado': estado, 'cuerpo': cuerpo} for estado, cuerpo in resultados
+            ]
+        }
+
+    def cerrar(self):
+        self.datos.cerrar()
+
+
+async def servir(ruta=RUTA_BD, puerto=PUERTO, hilos=HILOS_BD, commit_agrupado=False):
+    app = InventarioCajaApp(ruta, commit_agrupado=commit_agrupado, lectores=hilos)
+    servidor = ServidorInventario(app, hilos)
+    try:
+        escucha = await asyncio.start_server(servidor.atender, HOST, puerto)
+        print(f"Sirviendo {ruta} en http://{HOST}:{puerto}", flush=True)
+        async with escucha:
+            await escucha.serve_forever()
+    finally:
+        servidor.cerrar()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Servidor JSON local (sin interfaz) sobre el inventario'
+    )
+    parser.add_argument('--ruta', default=RUTA_BD)
+    parser.add_argument('--puerto', type=int, default=PUERTO)
+    parser.add_argument('--hilos', type=int, default=HILOS_BD,
+                        help='hilos de base de datos y conexiones lectoras')
+    parser.add_argument('--commit-agrupado', action='store_true')
+    args = parser.parse_args()
+    try:
+        asyncio.run(servir(args.ruta, args.puerto, args.hilos, args.commit_agrupado))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()